@@ -0,0 +1,434 @@
+import asyncio
+import json
+import mimetypes
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import langid
+from flask import render_template
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.http import http_date
+
+import message_search
+from app import (
+    app as flask_app, Conversation, ChatMessage, batchers, history_page, parse_history_params,
+    CONVERSATION_MAX_PAGE_SIZE, conversation_list_cache, conversation_list_page, conversation_list_statement,
+    decode_conversation_cursor,
+    GENERATION_KWARGS, kv_cache, known_conversations, lookup_cached_reply, model_registry, store_cached_reply,
+    validate_message, generate_reply_with_history, stream_reply_with_history,
+    message_writer, save_chat_turn, wait_for_pending_messages,
+)
+from streaming import sse_event, stream_pipeline
+
+#11_asgi:非同步 (ASGI) 服務入口
+# 一般回覆以 asyncio.wrap_future 等待批次器的結果，等待中的請求不佔用執行緒；
+# 串流生成在有界執行緒池中執行，資料庫 I/O 透過 aiomysql 非同步進行，
+# 聊天訊息與 Flask 路由共用 write-behind 佇列，不等資料庫提交
+# 啟動方式: uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 16))  # 同時進行的串流生成上限
+
+# 沿用 Flask 設定中的連線字串，改用非同步驅動
+database_uri = flask_app.config['SQLALCHEMY_DATABASE_URI'].replace("mysql+pymysql://", "mysql+aiomysql://")
+engine = create_async_engine(database_uri, pool_size=10, max_overflow=20, pool_pre_ping=True)
+generation_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
+
+# 首頁模板只需渲染一次
+with flask_app.test_request_context():
+    INDEX_HTML = render_template('index.html').encode("utf-8")
+STATIC_DIR = os.path.realpath(flask_app.static_folder)
+
+
+# HTTP 回應工具
+async def send_response(send, body, status=200, content_type=b"application/json"):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data, ensure_ascii=False, default=json_default).encode("utf-8")
+    await send_response(send, body, status=status)
+
+
+def json_default(value):
+    # 與 Flask jsonify 的日期格式一致
+    if isinstance(value, datetime):
+        return http_date(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return json.loads(body) if body else {}
+
+
+# 路由處理函數
+async def index(scope, receive, send):
+    await send_response(send, INDEX_HTML, content_type=b"text/html; charset=utf-8")
+
+
+async def static_file(scope, receive, send, filename):
+    file_path = os.path.realpath(os.path.join(STATIC_DIR, filename))
+    if not file_path.startswith(STATIC_DIR + os.sep) or not os.path.isfile(file_path):
+        return await send_json(send, {"error": "Not found"}, 404)
+
+    loop = asyncio.get_running_loop()
+    body = await loop.run_in_executor(None, read_file, file_path)
+    content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    await send_response(send, body, content_type=content_type.encode())
+
+
+def read_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+async def create_conversation(scope, receive, send):
+    data = await read_json(receive)
+    conversation_name = data.get('name', '新對話')
+    conversation_id = str(uuid.uuid4())
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(Conversation.__table__).values(
+            id=conversation_id, name=conversation_name, created_at=datetime.utcnow()
+        ))
+    conversation_list_cache.clear()
+
+    await send_json(send, {'id': conversation_id, 'name': conversation_name})
+
+
+# 檢查對話是否存在（已確認過的對話不再查詢資料庫）
+async def conversation_exists(conversation_id):
+    if known_conversations.get(conversation_id):
+        return True
+    async with engine.connect() as conn:
+        exists = await conn.scalar(select(Conversation.id).where(Conversation.id == conversation_id))
+    if exists:
+        known_conversations.set(conversation_id, True)
+    return bool(exists)
+
+
+# 保存一回合的訊息：啟用 write-behind 時與 Flask 路由相同，寫入 journal 後即返回（fsync 在預設執行緒池中進行），
+# 由背景批次寫入資料庫；停用時直接以非同步連線寫入
+async def insert_chat_turn(conversation_id, user_input, reply):
+    if message_writer is not None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, save_chat_turn, conversation_id, user_input, reply)
+
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        await conn.execute(insert(ChatMessage.__table__), [
+            {'conversation_id': conversation_id, 'sender': 'user', 'message': user_input, 'timestamp': now,
+             'client_message_id': str(uuid.uuid4())},
+            {'conversation_id': conversation_id, 'sender': 'ai', 'message': reply, 'timestamp': now,
+             'client_message_id': str(uuid.uuid4())},
+        ])
+
+
+# 回覆快取查詢與寫入：語意快取設定句向量模型時需要做一次 forward，在執行緒池中進行
+async def lookup_cached_reply_async(user_input, lang_key):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(generation_executor, lookup_cached_reply, user_input, lang_key)
+
+
+async def store_cached_reply_async(user_input, lang_key, reply):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(generation_executor, store_cached_reply, user_input, lang_key, reply)
+
+
+async def handle_message(scope, receive, send):
+    data = await read_json(receive)
+    user_input = data.get('message', '')
+    conversation_id = data.get('conversation_id')
+
+    error = validate_message(user_input, conversation_id)
+    if error:
+        return await send_json(send, {"error": error}, 400)
+
+    if not await conversation_exists(conversation_id):
+        return await send_json(send, {"error": "Conversation not found"}, 404)
+
+    lang, _ = langid.classify(user_input)
+    lang_key = 'en' if lang == 'en' else 'zh'
+
+    try:
+        if flask_app.config['KV_CACHE_ENABLED']:
+            # 以對話歷史為上下文，重用上一回合的 past key/values（在執行緒池中生成）
+            loop = asyncio.get_running_loop()
+            reply = await loop.run_in_executor(
+                generation_executor, generate_reply_with_history, conversation_id, lang_key, user_input
+            )
+        else:
+            reply = await lookup_cached_reply_async(user_input, lang_key)
+            if reply is None:
+                # 直接等待批次器的 Future，不佔用執行緒
+                reply = await asyncio.wrap_future(batchers[lang_key].submit_future(user_input))
+                await store_cached_reply_async(user_input, lang_key, reply)
+    except Exception as e:
+        print(f"模型生成回覆失敗: {e}")  # 添加日誌
+        return await send_json(send, {"error": f"生成回覆時出錯: {str(e)}"}, 500)
+
+    await insert_chat_turn(conversation_id, user_input, reply)
+    await send_json(send, {"reply": reply})
+
+
+# 在執行緒池中逐項讀取同步 iterator，以非同步方式 yield 每一項
+async def iterate_in_executor(make_iterator):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def pump():
+        try:
+            for item in make_iterator():
+                loop.call_soon_threadsafe(queue.put_nowait, ("item", item))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+
+    pump_future = loop.run_in_executor(generation_executor, pump)
+    while True:
+        kind, value = await queue.get()
+        if kind == "done":
+            break
+        if kind == "error":
+            raise value
+        yield value
+    await pump_future
+
+
+# 串流期間持有模型，避免被閒置釋放；啟用 KV 快取時以對話歷史為上下文
+def stream_reply(conversation_id, lang_key, user_input, generate_kwargs):
+    if flask_app.config['KV_CACHE_ENABLED']:
+        yield from stream_reply_with_history(conversation_id, lang_key, user_input)
+        return
+    with model_registry.use(lang_key) as ai_pipeline:
+        yield from stream_pipeline(ai_pipeline, user_input, **generate_kwargs)
+
+
+# 串流版本：以 Server-Sent Events 逐 token 回傳（與 Flask 的 /api/message_stream 格式相同）
+async def handle_message_stream(scope, receive, send):
+    data = await read_json(receive)
+    user_input = data.get('message', '')
+    conversation_id = data.get('conversation_id')
+
+    error = validate_message(user_input, conversation_id)
+    if error:
+        return await send_json(send, {"error": error}, 400)
+
+    if not await conversation_exists(conversation_id):
+        return await send_json(send, {"error": "Conversation not found"}, 404)
+
+    lang, _ = langid.classify(user_input)
+    lang_key = 'en' if lang == 'en' else 'zh'
+    generate_kwargs = {k: v for k, v in GENERATION_KWARGS.items() if k != "num_return_sequences"}
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    async def send_event(payload, event=None):
+        await send({"type": "http.response.body", "body": sse_event(payload, event).encode("utf-8"), "more_body": True})
+
+    try:
+        # 命中回覆快取時直接送出完整回覆
+        reply = await lookup_cached_reply_async(user_input, lang_key)
+        if reply is None:
+            # 與 pipeline 的 generated_text 一致：回覆以原始輸入開頭
+            chunks = [user_input]
+            await send_event({"token": user_input})
+            async for chunk in iterate_in_executor(
+                    lambda: stream_reply(conversation_id, lang_key, user_input, generate_kwargs)):
+                chunks.append(chunk)
+                await send_event({"token": chunk})
+            reply = "".join(chunks)
+            await store_cached_reply_async(user_input, lang_key, reply)
+
+        # 生成完成後才寫入資料庫
+        await insert_chat_turn(conversation_id, user_input, reply)
+        await send_event({"reply": reply}, event="done")
+    except Exception as e:
+        print(f"模型串流回覆失敗: {e}")  # 添加日誌
+        await send_event({"error": f"生成回覆時出錯: {str(e)}"}, event="error")
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+# 等待此刻之前送出的訊息寫入資料庫（與 Flask 路由相同），等待在預設執行緒池中進行
+async def wait_for_pending_messages_async():
+    if message_writer is None:
+        return True
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, wait_for_pending_messages)
+
+
+async def delete_conversation(scope, receive, send, conversation_id):
+    known_conversations.delete(conversation_id)
+    # 先讓尚未寫入的訊息落地，再一併刪除
+    await wait_for_pending_messages_async()
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(delete(ChatMessage.__table__).where(ChatMessage.conversation_id == conversation_id))
+            await conn.execute(delete(Conversation.__table__).where(Conversation.id == conversation_id))
+    except Exception as e:
+        return await send_json(send, {"error": f"刪除對話時出錯: {str(e)}"}, 500)
+
+    kv_cache.discard(conversation_id)
+    conversation_list_cache.clear()
+    await send_json(send, {"message": "對話已刪除"})
+
+
+async def rename_conversation(scope, receive, send, conversation_id):
+    data = await read_json(receive)
+    new_name = data.get('name')
+    if not new_name:
+        return await send_json(send, {"error": "Name is required"}, 400)
+
+    try:
+        async with engine.begin() as conn:
+            exists = await conn.scalar(select(Conversation.id).where(Conversation.id == conversation_id))
+            if not exists:
+                return await send_json(send, {"error": "Conversation not found"}, 404)
+            await conn.execute(
+                update(Conversation.__table__).where(Conversation.id == conversation_id).values(name=new_name)
+            )
+    except Exception as e:
+        return await send_json(send, {"error": str(e)}, 500)
+
+    conversation_list_cache.clear()
+    await send_json(send, {"id": conversation_id, "name": new_name})
+
+
+async def get_conversations(scope, receive, send):
+    params = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode("utf-8")).items()}
+    try:
+        limit = int(params.get('limit') or flask_app.config['CONVERSATION_PAGE_SIZE'])
+        days = int(params['days']) if params.get('days') else None
+        cursor = params.get('cursor') or None
+        if cursor:
+            decode_conversation_cursor(cursor)
+    except ValueError:
+        return await send_json(send, {"error": "Invalid pagination parameters"}, 400)
+    limit = min(max(limit, 1), CONVERSATION_MAX_PAGE_SIZE)
+
+    cache_key = (limit, cursor, days)
+    page = conversation_list_cache.get(cache_key) if flask_app.config['CONVERSATION_CACHE_TTL'] else None
+    if page is not None:
+        return await send_json(send, page)
+
+    async with engine.connect() as conn:
+        rows = (await conn.execute(conversation_list_statement(limit, cursor, days))).all()
+    page = conversation_list_page(rows, limit)
+    if flask_app.config['CONVERSATION_CACHE_TTL']:
+        conversation_list_cache.set(cache_key, page)
+    await send_json(send, page)
+
+
+async def get_chat_history(scope, receive, send, conversation_id):
+    params = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    limit, before_id = parse_history_params({key: values[0] for key, values in params.items()})
+    if limit is None:
+        return await send_json(send, {"error": "Invalid pagination parameters"}, 400)
+
+    if before_id is None:
+        await wait_for_pending_messages_async()
+    statement = select(ChatMessage.__table__).where(ChatMessage.conversation_id == conversation_id)
+    if before_id is not None:
+        statement = statement.where(ChatMessage.id < before_id)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            statement.order_by(ChatMessage.id.desc()).limit(limit + 1)
+        )).mappings().all()
+    await send_json(send, history_page([dict(row) for row in rows], limit))
+
+
+async def search_messages(scope, receive, send):
+    params = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    terms = message_search.split_terms(params.get('query', [''])[0])
+    limit, page = message_search.parse_paging(params.get('limit', [None])[0], params.get('page', [None])[0])
+    if not terms:
+        return await send_json(send, message_search.format_results([], terms, limit, page))
+
+    try:
+        statement, bind_params = message_search.build_search_statement(
+            engine.dialect.name, terms, limit, (page - 1) * limit
+        )
+        async with engine.connect() as conn:
+            rows = (await conn.execute(statement, bind_params)).all()
+    except Exception as e:
+        return await send_json(send, {'error': str(e)}, 500)
+
+    await send_json(send, message_search.format_results(rows, terms, limit, page))
+
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('POST', '/api/new_conversation'): create_conversation,
+    ('POST', '/api/message'): handle_message,
+    ('POST', '/api/message_stream'): handle_message_stream,
+    ('GET', '/api/conversations'): get_conversations,
+    ('GET', '/api/search_messages'): search_messages,
+}
+
+# 路徑最後一段為 conversation_id 的路由
+PREFIX_ROUTES = [
+    ('GET', '/api/chat_history/', get_chat_history),
+    ('DELETE', '/api/delete_conversation/', delete_conversation),
+    ('PUT', '/api/rename_conversation/', rename_conversation),
+]
+
+
+# ASGI 入口
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await engine.dispose()
+                generation_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    handler = ROUTES.get((method, path))
+    if handler:
+        return await handler(scope, receive, send)
+
+    if method == 'GET' and path.startswith('/static/'):
+        return await static_file(scope, receive, send, path[len('/static/'):])
+
+    for route_method, prefix, route_handler in PREFIX_ROUTES:
+        if method == route_method and path.startswith(prefix) and len(path) > len(prefix):
+            return await route_handler(scope, receive, send, path[len(prefix):])
+
+    await send_json(send, {"error": "Not found"}, 404)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("asgi_app:app", host="0.0.0.0", port=5001)
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from queue import Queue, Empty
+
+#09_batching:動態批次推論
+# 將同一模型在短時間窗口內收到的多個 prompt 合併成一次 forward，
+# 再把結果分送回各自等待的請求
+class MicroBatcher:
+    def __init__(self, generate_fn, max_batch_size=8, max_wait_ms=20, name="batcher"):
+        """
+        Args:
+            generate_fn: 接收 prompt 列表並回傳等長結果列表的函數
+            max_batch_size: 單一批次最多合併的 prompt 數
+            max_wait_ms: 收到第一個 prompt 後最多等待多久再送出批次
+            name: 背景執行緒名稱（方便除錯）
+        """
+        self.generate_fn = generate_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.name = name
+        self._start_worker()
+        # fork 出的子行程不會繼承背景執行緒，需重新啟動
+        os.register_at_fork(after_in_child=self._start_worker)
+
+    def _start_worker(self):
+        self._queue = Queue()
+        self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._worker.start()
+
+    # 提交一個 prompt 並立即回傳 Future；非同步呼叫端可用 asyncio.wrap_future 等待，不佔用執行緒
+    def submit_future(self, prompt):
+        future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    # 提交一個 prompt，阻塞直到批次完成並回傳該 prompt 的結果
+    def submit(self, prompt, timeout=None):
+        return self.submit_future(prompt).result(timeout=timeout)
+
+    # 收集一個批次：先阻塞等第一筆，之後在時間窗口內盡量補滿；
+    # 已被取消的 Future（例如 asyncio 端的請求中斷）直接略過，其餘標記為執行中後就無法再取消
+    def _collect(self):
+        batch = []
+        while not batch:
+            item = self._queue.get()
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            prompts = [prompt for prompt, _ in batch]
+            try:
+                results = self.generate_fn(prompts)
+                if len(results) != len(prompts):
+                    raise RuntimeError(f"批次結果數量不符: {len(results)} != {len(prompts)}")
+            except Exception as e:
+                for _, future in batch:
+                    self._resolve(future.set_exception, e)
+                continue
+            for (_, future), result in zip(batch, results):
+                self._resolve(future.set_result, result)
+
+    # 單一 Future 的狀態錯誤不能讓背景執行緒結束
+    def _resolve(self, setter, value):
+        try:
+            setter(value)
+        except InvalidStateError as e:
+            print(f"[{self.name}] 無法設定批次結果: {e}")  # 添加日誌
+
+
+# 將 Hugging Face text-generation pipeline 包裝成批次生成函數：整個批次左側 padding 後只做一次 generate
+# 左側 padding 後 generate 會把補齊的長度算進 max_length，新 token 數會受同批最長的 prompt 影響；
+# 因此每個 prompt 自己的預算為 max_length 減去自身長度，generate 以最大的預算執行，
+# 再把每一列截到自己的預算。預設的貪婪解碼搭配 attention mask 時每一列的輸出與同批其他 prompt 無關，
+# 截斷後的回覆與單獨生成相同
+def make_pipeline_batch_fn(ai_pipeline, max_length=50, truncation=True, num_return_sequences=1, **generate_kwargs):
+    import torch
+
+    tokenizer = ai_pipeline.tokenizer
+    model = ai_pipeline.model
+    # decoder-only 模型批次生成時需要左側 padding
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    def generate_batch(prompts):
+        inputs = tokenizer(list(prompts), return_tensors="pt", padding=True, truncation=truncation).to(model.device)
+        budgets = [max(1, max_length - int(n)) for n in inputs["attention_mask"].sum(dim=1)]
+        with torch.no_grad():
+            sequences = model.generate(
+                **inputs, max_new_tokens=max(budgets), pad_token_id=tokenizer.pad_token_id, **generate_kwargs
+            )
+        # 與 pipeline 的 generated_text 一致：回覆以原始輸入開頭
+        prompt_width = inputs["input_ids"].shape[1]
+        return [
+            prompt + tokenizer.decode(row[prompt_width:prompt_width + budget], skip_special_tokens=True)
+            for prompt, row, budget in zip(prompts, sequences.cpu(), budgets)
+        ]
+
+    return generate_batch
+
+
+# 每個批次執行時才向模型註冊表取得 pipeline，模型可按需載入或被閒置釋放
+def make_registry_batch_fn(registry, name, **generate_kwargs):
+    def generate_batch(prompts):
+        with registry.use(name) as ai_pipeline:
+            return make_pipeline_batch_fn(ai_pipeline, **generate_kwargs)(prompts)
+
+    return generate_batch
+
+
+# 示例
+if __name__ == "__main__":
+    def fake_generate(prompts):
+        print(f"批次大小: {len(prompts)}")
+        return [p.upper() for p in prompts]
+
+    batcher = MicroBatcher(fake_generate, max_batch_size=4, max_wait_ms=30)
+    threads = [threading.Thread(target=lambda i=i: print(batcher.submit(f"prompt {i}"))) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
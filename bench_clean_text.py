@@ -0,0 +1,87 @@
+import argparse
+import random
+import re
+import time
+import tracemalloc
+
+from data_cleaning import clean_stream, clean_text
+
+#bench_clean_text:比較 clean_text 與串流清理在大型中英混合語料上的吞吐量（MB/s）與峰值記憶體
+# 用法: python bench_clean_text.py --mb 50
+
+ZH_SENTENCES = [
+    "國立臺灣師範大學圖書館開放時間為上午八點至晚上十點。",
+    "學生宿舍申請請於學期開始前，向住宿輔導組提出！",
+    "選課系統（第二階段）將於９月１日開放，請同學留意公告。",
+]
+EN_SENTENCES = [
+    "The library opens at 8 a.m.; dorm applications must be filed before the semester!",
+    "Course registration (phase 2) starts on Sept. 1st -- check the announcements.",
+]
+
+
+def build_corpus(megabytes, seed=0):
+    rng = random.Random(seed)
+    target = megabytes * 1024 * 1024
+    lines, size = [], 0
+    while size < target:
+        pool = ZH_SENTENCES if rng.random() < 0.6 else EN_SENTENCES
+        line = "  ".join(rng.choice(pool) for _ in range(rng.randint(1, 4))) + "\n"
+        lines.append(line)
+        size += len(line.encode("utf-8"))
+    return lines
+
+
+# 原本的三次完整掃描實作，作為對照
+def legacy_clean_text(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s]', '', text)
+    return text.lower()
+
+
+# 將行合併成約 block_size bytes 的區塊，減少逐行呼叫的開銷
+def iter_blocks(lines, block_size=1 << 20):
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= block_size:
+            yield "".join(block)
+            block, size = [], 0
+    if block:
+        yield "".join(block)
+
+
+def measure(label, func, megabytes):
+    # 計時與記憶體分開量測，避免 tracemalloc 影響吞吐量
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>14} {megabytes / elapsed:>10.1f} {peak / 1024 / 1024:>12.1f}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="clean_text 吞吐量測試")
+    parser.add_argument("--mb", type=int, default=20, help="測試語料大小（MB）")
+    args = parser.parse_args()
+
+    lines = build_corpus(args.mb)
+    text = "".join(lines)
+    megabytes = len(text.encode("utf-8")) / 1024 / 1024
+    print(f"語料大小: {megabytes:.1f} MB")
+    print(f"{'方法':>14} {'MB/s':>10} {'峰值記憶體MB':>12}")
+
+    expected = measure("legacy", lambda: legacy_clean_text(text), megabytes)
+    cleaned = measure("clean_text", lambda: clean_text(text), megabytes)
+    streamed = measure("clean_stream", lambda: "".join(clean_stream(iter_blocks(lines))), megabytes)
+    # 串流時輸出直接交給下游（例如寫檔或 tokenization），不累積整份結果
+    measure("stream(逐行)", lambda: sum(len(c) for c in clean_stream(lines)), megabytes)
+    measure("stream(區塊)", lambda: sum(len(c) for c in clean_stream(iter_blocks(lines))), megabytes)
+
+    assert cleaned == expected and streamed == expected, "清理結果不一致"
+    print("輸出與原實作一致")
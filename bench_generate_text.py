@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import torch
+
+from generate_text import generate_text
+from model import LanguageModel
+
+#bench_generate_text:比較增量解碼（沿用 LSTM 狀態）與原本每步重算整個視窗的生成速度
+# 用法: python bench_generate_text.py --seq-length 20 40 80 --max-length 50
+
+
+def build_model_and_vocab(vocab_size, embed_size, hidden_size):
+    torch.manual_seed(0)
+    model = LanguageModel(vocab_size, embed_size, hidden_size)
+    vocab = {f"w{i}": i for i in range(1, model.vocab_size)}
+    inv_vocab = {v: k for k, v in vocab.items()}
+    return model, vocab, inv_vocab
+
+
+def time_generation(model, vocab, inv_vocab, start_text, max_length, seq_length, use_cache, repeats):
+    # 暖機
+    generate_text(model, start_text, vocab, inv_vocab, max_length=5, seq_length=seq_length, use_cache=use_cache)
+    tokens = 0
+    started = time.perf_counter()
+    for _ in range(repeats):
+        text = generate_text(model, start_text, vocab, inv_vocab,
+                             max_length=max_length, seq_length=seq_length, use_cache=use_cache)
+        tokens += len(text.split()) - len(start_text.split())
+    elapsed = time.perf_counter() - started
+    return tokens / elapsed, elapsed / max(tokens, 1) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate_text 增量解碼效能測試")
+    parser.add_argument("--seq-length", type=int, nargs="+", default=[20, 40, 80])
+    parser.add_argument("--max-length", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--vocab-size", type=int, default=5000)
+    parser.add_argument("--embed-size", type=int, default=128)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    model, vocab, inv_vocab = build_model_and_vocab(args.vocab_size, args.embed_size, args.hidden_size)
+    start_text = " ".join(f"w{i}" for i in range(1, 11))
+
+    print(f"{'seq_length':>10} {'模式':>8} {'tokens/s':>10} {'ms/token':>10}")
+    for seq_length in args.seq_length:
+        for use_cache, label in ((False, "視窗重算"), (True, "增量解碼")):
+            torch.manual_seed(0)
+            tokens_per_sec, ms_per_token = time_generation(
+                model, vocab, inv_vocab, start_text, args.max_length, seq_length, use_cache, args.repeats
+            )
+            print(f"{seq_length:>10} {label:>8} {tokens_per_sec:>10.1f} {ms_per_token:>10.3f}")
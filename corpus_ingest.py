@@ -0,0 +1,92 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from data_extraction import extract_pdf_text, extract_word_text
+
+#19_corpus_ingest:以多行程平行擷取整個目錄的 PDF 與 Word 文件
+EXTRACTORS = {
+    ".pdf": extract_pdf_text,
+    ".docx": extract_word_text,
+}
+
+
+# 遞迴列出目錄下所有支援的文件，依路徑排序確保順序固定
+def iter_documents(root):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in filenames:
+            if filename.startswith("~$"):  # Word 暫存檔
+                continue
+            if os.path.splitext(filename)[1].lower() in EXTRACTORS:
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def extract_document(path):
+    extractor = EXTRACTORS[os.path.splitext(path)[1].lower()]
+    try:
+        return path, extractor(path), None
+    except Exception as e:
+        return path, "", f"{type(e).__name__}: {e}"
+
+
+def ingest_directory(root, max_workers=None, max_in_flight=None):
+    """
+    平行擷取目錄下的文件，依檔案路徑順序逐一 yield (path, text)
+
+    Args:
+        root: 文件目錄
+        max_workers: 行程數，預設為 CPU 核心數
+        max_in_flight: 同時處理中的文件上限，限制已完成但尚未被取用的結果佔用的記憶體
+    """
+    return extract_paths(iter_documents(root), max_workers=max_workers, max_in_flight=max_in_flight)
+
+
+# 平行擷取指定的文件，依傳入順序 yield (path, text)
+def extract_paths(paths, max_workers=None, max_in_flight=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or max_workers * 4
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        path_iter = iter(paths)
+        for path in path_iter:
+            pending.append(executor.submit(extract_document, path))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            path, text, error = pending.popleft().result()
+            next_path = next(path_iter, None)
+            if next_path is not None:
+                pending.append(executor.submit(extract_document, next_path))
+            if error:
+                print(f"擷取失敗 {path}: {error}")
+                continue
+            yield path, text
+
+
+# 擷取並清理目錄下的所有文件，依序 yield 清理後的文字
+def iter_cleaned_corpus(root, max_workers=None):
+    from data_cleaning import clean_text
+
+    for _, text in ingest_directory(root, max_workers=max_workers):
+        yield clean_text(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="平行擷取目錄下的 PDF 與 Word 文件")
+    parser.add_argument("root", help="文件目錄")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = 0
+    total_chars = 0
+    for path, text in ingest_directory(args.root, max_workers=args.workers):
+        count += 1
+        total_chars += len(text)
+    print(f"擷取 {count} 份文件，共 {total_chars} 個字元，耗時 {time.perf_counter() - started:.1f}s")
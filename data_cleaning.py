@@ -1,12 +1,46 @@
 import re
+import unicodedata
 #02_data_cleaning：清理和分詞
+# 預先編譯的規則；str 模式下 \w 與 \s 皆為 Unicode 語意，中文字保留、全形標點與全形空白（\u3000）會被處理
+_WHITESPACE_RE = re.compile(r'\s+')
+_PUNCT_RE = re.compile(r'[^\w\s]+')
+
 # 数据清理
-def clean_text(text):
-    text = re.sub(r'\s+', ' ', text)  # 去除多余的空格
-    text = re.sub(r'[^\w\s]', '', text)  # 去除标点符号
+def clean_text(text, nfkc=False):
+    """
+    Args:
+        text: 原始文本
+        nfkc: 是否先做 NFKC 正規化（全形英數字轉半形，例如 "ＡＢＣ１２３" -> "abc123"）
+    """
+    if nfkc:
+        text = unicodedata.normalize("NFKC", text)
+    text = _WHITESPACE_RE.sub(' ', text)  # 去除多余的空格
+    text = _PUNCT_RE.sub('', text)  # 去除标点符号
     text = text.lower()  # 转为小写
     return text
 
+# 串流清理：逐塊（頁、段落或行）處理，輸出與對整份文本呼叫 clean_text 相同，
+# 但記憶體只與單一區塊大小成正比
+def clean_stream(chunks, nfkc=False):
+    pending_space = False  # 上一塊結尾的空白，需與下一塊開頭的空白合併
+    for chunk in chunks:
+        if nfkc:
+            chunk = unicodedata.normalize("NFKC", chunk)
+        # rstrip 只從結尾掃描，不必再走過整個區塊
+        body = chunk.rstrip()
+        has_trailing_space = len(body) < len(chunk)
+        if not body:
+            pending_space = pending_space or has_trailing_space
+            continue
+        if pending_space:
+            body = ' ' + body.lstrip()
+        cleaned = clean_text(body)
+        if cleaned:
+            yield cleaned
+        pending_space = has_trailing_space
+    if pending_space:
+        yield ' '
+
 # 示例
 if __name__ == "__main__":
     from data_extraction import extract_pdf_text, extract_word_text
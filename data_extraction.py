@@ -2,21 +2,25 @@ from PyPDF2 import PdfReader
 from docx import Document
 
 #01_data extraction:從 PDF 和 Word 文件中提取文本
-# 提取 PDF 文本
-def extract_pdf_text(file_path):
+# 逐頁產生 PDF 文本，頁面在迭代時才解析，可串流處理大型 PDF
+def iter_pdf_pages(file_path):
     reader = PdfReader(file_path)
-    text = ""
     for page in reader.pages:
-        text += page.extract_text()
-    return text
+        yield page.extract_text() or ""
 
-# 提取 Word 文本
-def extract_word_text(file_path):
+# 逐段產生 Word 文本（每段以換行結尾）
+def iter_word_paragraphs(file_path):
     doc = Document(file_path)
-    text = ""
     for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
+        yield paragraph.text + "\n"
+
+# 提取 PDF 文本
+def extract_pdf_text(file_path):
+    return "".join(iter_pdf_pages(file_path))
+
+# 提取 Word 文本
+def extract_word_text(file_path):
+    return "".join(iter_word_paragraphs(file_path))
 
 # 示例：读取文件
 if __name__ == "__main__":
@@ -2,12 +2,21 @@ import numpy as np
 
 #04_data_preparation：將 Token 序列切分為輸入和目標
 # 序列化数据
+# 以 sliding_window_view 建立視窗，inputs/targets 都是同一個 token 陣列的 view，不複製資料
 def create_sequences(tokens, seq_length):
-    inputs, targets = [], []
-    for i in range(len(tokens) - seq_length):
-        inputs.append(tokens[i:i + seq_length])
-        targets.append(tokens[i + seq_length])
-    return np.array(inputs), np.array(targets)
+    tokens = np.asarray(tokens)
+    num_sequences = len(tokens) - seq_length
+    if num_sequences <= 0:
+        return np.empty((0, seq_length), dtype=tokens.dtype), np.empty((0,), dtype=tokens.dtype)
+    inputs = np.lib.stride_tricks.sliding_window_view(tokens, seq_length)[:num_sequences]
+    targets = tokens[seq_length:]
+    return inputs, targets
+
+# 分塊產生序列，每塊最多 chunk_size 筆（同樣是 view），適合大型語料逐塊處理
+def iter_sequences(tokens, seq_length, chunk_size=65536):
+    inputs, targets = create_sequences(tokens, seq_length)
+    for start in range(0, len(targets), chunk_size):
+        yield inputs[start:start + chunk_size], targets[start:start + chunk_size]
 
 # 示例
 if __name__ == "__main__":
@@ -1,18 +1,29 @@
 import torch
 import torch.nn.functional as F
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 import numpy as np
+from tokenization import SPECIAL_TOKENS, UNK_TOKEN, decode_batch
 
-def generate_text(model: torch.nn.Module, 
-                 start_text: str, 
-                 vocab: Dict[str, int], 
-                 inv_vocab: Optional[Dict[int, str]] = None,
-                 max_length: int = 50,
-                 seq_length: int = 20,
-                 temperature: float = 0.7,
-                 top_k: int = 40) -> str:
+# 起始文本轉成 token id：詞級模型以空白分詞查詞彙表，subword 模型交給 tokenizer 編碼
+def encode_prompt(text: str, vocab: Dict[str, int], tokenizer=None) -> List[int]:
+    text = text.lower()
+    if tokenizer is not None:
+        return tokenizer.encode(text).ids
+    unk_id = vocab.get(UNK_TOKEN, 0)
+    return [vocab.get(word, unk_id) for word in text.split()]
+
+def generate_text_stream(model: torch.nn.Module, 
+                         start_text: str, 
+                         vocab: Dict[str, int], 
+                         inv_vocab: Optional[Dict[int, str]] = None,
+                         max_length: int = 50,
+                         seq_length: int = 20,
+                         temperature: float = 0.7,
+                         top_k: int = 40,
+                         use_cache: bool = True,
+                         tokenizer=None) -> Iterator[str]:
     """
-    改進的文本生成函數
+    串流版本的文本生成函數，每生成一個 token 就立即 yield（不含起始文本）
     
     Args:
         model: 訓練好的語言模型
@@ -23,20 +34,20 @@ def generate_text(model: torch.nn.Module,
         seq_length: 序列長度
         temperature: 採樣溫度，控制生成文本的隨機性
         top_k: top-k 採樣的 k 值
+        use_cache: 是否沿用 LSTM 狀態 (h, c) 增量解碼；
+                   關閉時每一步都重新計算最近 seq_length 個 token 的完整序列
+        tokenizer: subword tokenizer；提供時以它編碼起始文本，並 yield 每一步解碼出的新增文字
     """
     # 創建反向詞彙表（如果沒有提供）
     if inv_vocab is None:
         inv_vocab = {v: k for k, v in vocab.items()}
     
     model.eval()
-    words = start_text.lower().split()
     
     # 處理輸入序列
-    input_ids = []
-    for word in words:
-        word_id = vocab.get(word, 0)
-        word_id = min(word_id, model.vocab_size - 1)
-        input_ids.append(word_id)
+    input_ids = [min(word_id, model.vocab_size - 1) for word_id in encode_prompt(start_text, vocab, tokenizer)]
+    generated_ids = list(input_ids)
+    decoded = tokenizer.decode(generated_ids) if tokenizer is not None else ""
     
     # 如果輸入序列太短，用 0 填充
     if len(input_ids) < seq_length:
@@ -46,11 +57,15 @@ def generate_text(model: torch.nn.Module,
     input_seq = torch.tensor(input_ids[-seq_length:], dtype=torch.long).unsqueeze(0)
     
     # 生成文本
-    generated_words = words.copy()
+    hidden = None
     with torch.no_grad():
         for _ in range(max_length):
             try:
-                output = model(input_seq)
+                if use_cache:
+                    # 第一步處理完整輸入序列，之後只處理新 token
+                    output, hidden = model.forward_step(input_seq, hidden)
+                else:
+                    output = model(input_seq)
                 
                 # 應用溫度
                 logits = output / temperature
@@ -63,25 +78,161 @@ def generate_text(model: torch.nn.Module,
                 next_token_idx = torch.multinomial(probs, num_samples=1)
                 next_word_id = top_k_indices[0][next_token_idx[0]].item()
                 
-                # 確保生成的 id 有對應的詞
-                if next_word_id in inv_vocab:
-                    next_word = inv_vocab[next_word_id]
-                    generated_words.append(next_word)
+                # 確保生成的 id 有對應的詞（<pad>/<unk> 視為結束）
+                if next_word_id not in inv_vocab or inv_vocab[next_word_id] in SPECIAL_TOKENS:
+                    break
+                generated_ids.append(next_word_id)
+                if tokenizer is not None:
+                    # subword 需解碼整段才能正確還原空白，只輸出新增的部分
+                    text = tokenizer.decode(generated_ids)
+                    yield text[len(decoded):]
+                    decoded = text
+                else:
+                    yield inv_vocab[next_word_id]
                 
-                    # 更新輸入序列
-                    input_ids = [vocab.get(w, 0) for w in generated_words[-seq_length:]]
-                    input_seq = torch.tensor(input_ids, dtype=torch.long).unsqueeze(0)
+                # 更新輸入序列
+                if use_cache:
+                    input_seq = torch.tensor([[min(next_word_id, model.vocab_size - 1)]], dtype=torch.long)
                 else:
-                    break
+                    window = [min(i, model.vocab_size - 1) for i in generated_ids[-seq_length:]]
+                    input_seq = torch.tensor(window, dtype=torch.long).unsqueeze(0)
                     
             except Exception as e:
                 print(f"Error during text generation: {e}")
                 break
+
+def generate_text(model: torch.nn.Module, 
+                 start_text: str, 
+                 vocab: Dict[str, int], 
+                 inv_vocab: Optional[Dict[int, str]] = None,
+                 max_length: int = 50,
+                 seq_length: int = 20,
+                 temperature: float = 0.7,
+                 top_k: int = 40,
+                 use_cache: bool = True,
+                 tokenizer=None) -> str:
+    """
+    改進的文本生成函數
     
-    return " ".join(generated_words)
+    Args:
+        model: 訓練好的語言模型
+        start_text: 起始文本
+        vocab: 詞彙表 (word -> id)
+        inv_vocab: 反向詞彙表 (id -> word)
+        max_length: 生成文本的最大長度
+        seq_length: 序列長度
+        temperature: 採樣溫度，控制生成文本的隨機性
+        top_k: top-k 採樣的 k 值
+        use_cache: 是否沿用 LSTM 狀態增量解碼
+        tokenizer: subword tokenizer（詞級模型為 None）
+    """
+    pieces = list(generate_text_stream(
+        model, start_text, vocab, inv_vocab,
+        max_length=max_length, seq_length=seq_length,
+        temperature=temperature, top_k=top_k, use_cache=use_cache, tokenizer=tokenizer
+    ))
+    if tokenizer is not None:
+        return tokenizer.decode(encode_prompt(start_text, vocab, tokenizer)) + "".join(pieces)
+    return " ".join(start_text.lower().split() + pieces)
+
+def generate_batch(model: torch.nn.Module,
+                   prompts: List[str],
+                   vocab: Dict[str, int],
+                   inv_vocab: Optional[Dict[int, str]] = None,
+                   max_length: int = 50,
+                   seq_length: int = 20,
+                   temperature: float = 0.7,
+                   top_k: int = 40,
+                   eos_id: Optional[int] = None,
+                   tokenizer=None) -> List[str]:
+    """
+    批次文本生成：多個 prompt 同時做 LSTM 前向與 top-k 採樣
+
+    Args:
+        model: 訓練好的語言模型
+        prompts: 起始文本列表
+        vocab: 詞彙表 (word -> id)
+        inv_vocab: 反向詞彙表 (id -> word)
+        max_length: 每個序列生成的最大長度
+        seq_length: 輸入視窗長度（不足時左側補 0）
+        temperature: 採樣溫度
+        top_k: top-k 採樣的 k 值
+        eos_id: 生成到此 id 時該序列提前結束
+        tokenizer: subword tokenizer（詞級模型為 None）
+    """
+    if not prompts:
+        return []
+    if inv_vocab is None:
+        inv_vocab = {v: k for k, v in vocab.items()}
+
+    model.eval()
+    vocab_size = model.vocab_size
+    batch_size = len(prompts)
+    prompt_ids = [encode_prompt(prompt, vocab, tokenizer) for prompt in prompts]
+
+    # 左側補 0，對齊成 [batch, seq_length] 的輸入
+    input_seq = torch.zeros(batch_size, seq_length, dtype=torch.long)
+    for row, ids in enumerate(prompt_ids):
+        ids = [min(i, vocab_size - 1) for i in ids][-seq_length:]
+        if ids:
+            input_seq[row, seq_length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+
+    # 有對應詞的 id 才是合法輸出，其餘視為結束（與 generate_text 的行為一致）
+    valid_ids = torch.zeros(vocab_size, dtype=torch.bool)
+    known_ids = [i for i, word in inv_vocab.items() if 0 <= i < vocab_size and word not in SPECIAL_TOKENS]
+    valid_ids[known_ids] = True
+    if eos_id is not None and 0 <= eos_id < vocab_size:
+        valid_ids[eos_id] = False
+
+    generated = torch.zeros(batch_size, max_length, dtype=torch.long)
+    finished = torch.zeros(batch_size, dtype=torch.bool)
+    lengths = torch.zeros(batch_size, dtype=torch.long)
+    k = min(top_k, vocab_size)
+
+    with torch.no_grad():
+        output, hidden = model.forward_step(input_seq)
+        for step in range(max_length):
+            logits = output / temperature
+            top_k_logits, top_k_indices = torch.topk(logits, k=k, dim=-1)
+            probs = F.softmax(top_k_logits, dim=-1)
+            next_token_idx = torch.multinomial(probs, num_samples=1)
+            next_ids = top_k_indices.gather(1, next_token_idx).squeeze(1)
+
+            # 已結束的序列不再累計長度
+            finished |= ~valid_ids[next_ids]
+            generated[:, step] = next_ids
+            lengths += (~finished).long()
+            if finished.all():
+                break
+            output, hidden = model.forward_step(next_ids.unsqueeze(1), hidden)
+
+    outputs = [ids[:length] for ids, length in zip(generated.tolist(), lengths.tolist())]
+    if tokenizer is not None:
+        return decode_batch(tokenizer, [prompt + ids for prompt, ids in zip(prompt_ids, outputs)])
+    return [" ".join(prompt.lower().split() + [inv_vocab[i] for i in ids]) for prompt, ids in zip(prompts, outputs)]
+
+def sample_responses(model, user_inputs: List[str], vocab: Dict[str, int],
+                     inv_vocab: Dict[int, str], tokenizer=None) -> List[str]:
+    """
+    批次版本的 sample_response
+    """
+    try:
+        return generate_batch(
+            model=model,
+            prompts=user_inputs,
+            vocab=vocab,
+            inv_vocab=inv_vocab,
+            max_length=50,
+            seq_length=20,
+            temperature=0.7,
+            top_k=40,
+            tokenizer=tokenizer
+        )
+    except Exception as e:
+        return [f"抱歉，生成回應時出現錯誤：{str(e)}"] * len(user_inputs)
 
 def sample_response(model, user_input: str, vocab: Dict[str, int], 
-                   inv_vocab: Dict[int, str]) -> str:
+                   inv_vocab: Dict[int, str], tokenizer=None) -> str:
     """
     基於用戶輸入生成回應
     """
@@ -94,7 +245,8 @@ def sample_response(model, user_input: str, vocab: Dict[str, int],
             max_length=50,
             seq_length=20,
             temperature=0.7,
-            top_k=40
+            top_k=40,
+            tokenizer=tokenizer
         )
         return response
     except Exception as e:
@@ -102,34 +254,12 @@ def sample_response(model, user_input: str, vocab: Dict[str, int],
 
 # 主程序
 if __name__ == "__main__":
-    from model import LanguageModel
-    from save_load_model import load_model
-    from tokenization import build_vocab
-    from data_cleaning import clean_text
-    from data_extraction import extract_pdf_text, extract_word_text
+    from save_load_model import load_for_inference
 
     try:
-        # 讀取數據
-        pdf_text = extract_pdf_text("/Users/sma01/Downloads/testdata.pdf")
-        word_text = extract_word_text("/Users/sma01/Downloads/testdata.docx")
-        all_text = pdf_text + word_text
-        cleaned_text = clean_text(all_text)
-        
-        # 構建詞彙表
-        vocab = build_vocab(cleaned_text)
-        vocab_size = max(1000, len(vocab) + 1)
-        
-        # 創建反向詞彙表
-        inv_vocab = {v: k for k, v in vocab.items()}
-        
-        # 初始化模型
-        embed_size = 128
-        hidden_size = 256
-        model = LanguageModel(vocab_size, embed_size, hidden_size)
-        
-        # 加載模型
-        loaded_vocab_size = load_model(model, "ntnuchatAI/language_model.pth")
-        print(f"Loaded model vocab size: {loaded_vocab_size}")
+        # 模型、詞彙表與 tokenizer 設定都從 checkpoint 還原，不需要重新解析文件
+        model, vocab, inv_vocab, settings = load_for_inference("ntnuchatAI/language_model.pth")
+        print(f"Loaded model config: {model.get_config()}")
         print(f"Current vocab size: {len(vocab)}")
         
         # 測試生成
@@ -138,9 +268,11 @@ if __name__ == "__main__":
             model=model,
             start_text=start_text,
             vocab=vocab,
-            inv_vocab=inv_vocab
+            inv_vocab=inv_vocab,
+            seq_length=settings.get("seq_length", 20),
+            tokenizer=settings.get("tokenizer")
         )
         print("生成的文本：", generated_text)
         
     except Exception as e:
-        print(f"Error occurred: {e}")
\ No newline at end of file
+        print(f"Error occurred: {e}")
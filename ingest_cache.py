@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import xxhash
+
+from corpus_ingest import extract_paths, iter_documents
+
+#20_ingest_cache:以內容雜湊增量更新語料
+# manifest 記錄每份文件的內容雜湊，清理後的文字依雜湊存放；
+# 只有新增或內容變動的文件需要重新擷取，未變動的直接讀取快取
+MANIFEST_NAME = "manifest.json"
+
+
+def hash_file(path, chunk_size=1 << 20):
+    hasher = xxhash.xxh3_64()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class IngestCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.text_dir = os.path.join(cache_dir, "texts")
+        os.makedirs(self.text_dir, exist_ok=True)
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def text_path(self, content_hash):
+        return os.path.join(self.text_dir, content_hash + ".txt")
+
+    # 檔案大小與修改時間都沒變時沿用舊雜湊，不必重讀整個檔案
+    def current_hash(self, path):
+        stat = os.stat(path)
+        entry = self.manifest.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["hash"], stat
+        return hash_file(path), stat
+
+    def read_text(self, path):
+        with open(self.text_path(self.manifest[path]["hash"]), encoding="utf-8") as f:
+            return f.read()
+
+    def sync(self, root, max_workers=None):
+        """
+        同步目錄與快取，回傳 (changed_paths, removed_paths)
+        """
+        from data_cleaning import clean_text
+
+        paths = iter_documents(root)
+        to_extract = []
+        stats = {}
+        for path in paths:
+            content_hash, stat = self.current_hash(path)
+            stats[path] = (content_hash, stat)
+            entry = self.manifest.get(path)
+            if entry and entry["hash"] == content_hash and os.path.exists(self.text_path(content_hash)):
+                # 內容沒變，只更新 stat 資訊
+                entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+                continue
+            if os.path.exists(self.text_path(content_hash)):
+                # 相同內容已在別的路徑擷取過
+                self.manifest[path] = {"hash": content_hash, "size": stat.st_size, "mtime": stat.st_mtime}
+                continue
+            to_extract.append(path)
+
+        changed = []
+        for path, text in extract_paths(to_extract, max_workers=max_workers):
+            content_hash, stat = stats[path]
+            tmp_path = self.text_path(content_hash) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(clean_text(text))
+            os.replace(tmp_path, self.text_path(content_hash))
+            self.manifest[path] = {"hash": content_hash, "size": stat.st_size, "mtime": stat.st_mtime}
+            changed.append(path)
+
+        current = set(paths)
+        removed = [path for path in self.manifest if path not in current]
+        for path in removed:
+            del self.manifest[path]
+        self._remove_orphan_texts()
+        self.save_manifest()
+        return changed, removed
+
+    def _remove_orphan_texts(self):
+        used = {entry["hash"] + ".txt" for entry in self.manifest.values()}
+        for filename in os.listdir(self.text_dir):
+            if filename.endswith(".txt") and filename not in used:
+                os.remove(os.path.join(self.text_dir, filename))
+
+    # 依路徑順序產生清理後的文字
+    def iter_texts(self):
+        for path in sorted(self.manifest):
+            yield self.read_text(path)
+
+
+# 同步文件目錄並在有變動時重建 token store（只有變動的文件會重新擷取）
+def update_token_store(root, cache_dir, prefix, max_workers=None):
+    from token_store import choose_dtype, exists, write_token_store
+    from tokenization import build_vocab, text_to_tokens
+
+    cache = IngestCache(cache_dir)
+    changed, removed = cache.sync(root, max_workers=max_workers)
+    if not changed and not removed and exists(prefix):
+        return changed, removed
+
+    # 逐份文件讀取：詞彙表與 token 各掃描一次快取，記憶體不需容納整個語料的字串
+    vocab = build_vocab(cache.iter_texts())
+    tokens = np.fromiter(
+        (token for text in cache.iter_texts() for token in text_to_tokens(text, vocab)),
+        dtype=choose_dtype(vocab),
+    )
+    write_token_store(prefix, tokens, vocab, {
+        "sources": [os.path.abspath(root)],
+        "documents": len(cache.manifest),
+    })
+    return changed, removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量更新文件快取與 token store")
+    parser.add_argument("root", help="文件目錄")
+    parser.add_argument("--cache-dir", default="ntnuchatAI/ingest_cache")
+    parser.add_argument("--out", default="ntnuchatAI/corpus", help="token store 路徑前綴")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    changed, removed = update_token_store(args.root, args.cache_dir, args.out, max_workers=args.workers)
+    print(f"重新擷取 {len(changed)} 份、移除 {len(removed)} 份文件，耗時 {time.perf_counter() - started:.1f}s")
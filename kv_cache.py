@@ -0,0 +1,208 @@
+import threading
+from collections import OrderedDict
+
+import torch
+
+#15_kv_cache:跨回合重用對話的 past key/values
+# 計算 past_key_values 佔用的記憶體（支援 DynamicCache 與舊版 tuple 格式）
+def past_key_values_bytes(past_key_values):
+    if hasattr(past_key_values, "key_cache"):
+        tensors = list(past_key_values.key_cache) + list(past_key_values.value_cache)
+    else:
+        tensors = [t for layer in past_key_values for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _CachedContext:
+    def __init__(self, model_key, input_ids, past_key_values):
+        self.model_key = model_key
+        self.input_ids = input_ids  # 已處理過的完整 token 序列 [1, L]
+        self.past_key_values = past_key_values
+        self.nbytes = past_key_values_bytes(past_key_values) + input_ids.numel() * input_ids.element_size()
+
+
+class ConversationKVCache:
+    def __init__(self, max_mb=512):
+        """
+        Args:
+            max_mb: 所有對話快取合計的記憶體上限（MB），超出時依 LRU 釋放
+        """
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # 取出並移除快取，生成期間由呼叫者獨佔，避免同一對話的並發請求互相覆寫
+    def pop(self, conversation_id, model_key):
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is not None:
+                self._total_bytes -= entry.nbytes
+            # 換了語言（模型）時舊的快取無法沿用
+            if entry is None or entry.model_key != model_key:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, conversation_id, entry):
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(conversation_id, None)
+            if old is not None:
+                self._total_bytes -= old.nbytes
+            self._entries[conversation_id] = entry
+            self._total_bytes += entry.nbytes
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+
+    def discard(self, conversation_id):
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is not None:
+                self._total_bytes -= entry.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'conversations': len(self._entries),
+                'size_mb': round(self._total_bytes / 1024 / 1024, 1),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 1),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# 回合之間的分隔；快取命中與未命中兩條路徑都以相同的 token 分隔，上下文才會一致
+TURN_SEPARATOR = "\n"
+
+
+def turn_separator_ids(tokenizer):
+    ids = tokenizer(TURN_SEPARATOR, add_special_tokens=False).input_ids
+    if not ids:
+        # 會去除空白的 tokenizer（例如 BERT 風格的中文 GPT-2）改用 [SEP] 或 EOS
+        token_id = tokenizer.sep_token_id if tokenizer.sep_token_id is not None else tokenizer.eos_token_id
+        ids = [token_id] if token_id is not None else []
+    return ids
+
+
+# 將歷史訊息整理成各回合的文字（AI 回覆以用戶輸入開頭時只取生成的部分）
+def history_to_turns(messages):
+    turns = []
+    last_user = None
+    for sender, message in messages:
+        if sender == 'user':
+            turns.append(message)
+            last_user = message
+        else:
+            if last_user and message.startswith(last_user):
+                message = message[len(last_user):]
+            turns.append(message)
+            last_user = None
+    return turns
+
+
+# 逐回合編碼並以分隔 token 連接，回傳 [1, L]
+def encode_turns(tokenizer, turns):
+    separator = turn_separator_ids(tokenizer)
+    ids = []
+    for turn in turns:
+        if ids:
+            ids.extend(separator)
+        ids.extend(tokenizer(turn, add_special_tokens=False).input_ids)
+    return torch.tensor([ids], dtype=torch.long)
+
+
+# 組出本回合的輸入：命中快取時只接上分隔與本回合輸入，未命中時由歷史重建；
+# 回傳 model.generate 的參數（不含 streamer）
+def _prepare_generation(ai_pipeline, kv_cache, conversation_id, model_key, prompt, max_length, history_loader):
+    tokenizer = ai_pipeline.tokenizer
+    model = ai_pipeline.model
+    max_context = getattr(model.config, "max_position_embeddings", 1024)
+
+    prompt_ids = tokenizer(prompt, return_tensors="pt", add_special_tokens=False).input_ids
+    entry = kv_cache.pop(conversation_id, model_key)
+    if entry is not None:
+        # 快取的序列以上一回合的回覆結尾，接上分隔後再接本回合輸入
+        separator = torch.tensor([turn_separator_ids(tokenizer)], dtype=torch.long)
+        input_ids = torch.cat([entry.input_ids, separator, prompt_ids], dim=1)
+        past_key_values = entry.past_key_values
+    else:
+        history = history_to_turns(history_loader()) if history_loader else []
+        input_ids = encode_turns(tokenizer, history + [prompt])
+        # 由 generate 建立模型支援的快取格式（GPT-2 不接受傳入 DynamicCache）
+        past_key_values = None
+
+    max_new_tokens = max(1, max_length - prompt_ids.shape[1])
+    # 超出模型可處理的長度時截斷舊的上下文，快取需重新計算
+    if input_ids.shape[1] + max_new_tokens > max_context:
+        input_ids = input_ids[:, -(max_context - max_new_tokens):]
+        past_key_values = None
+
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    return dict(
+        input_ids=input_ids.to(model.device),
+        attention_mask=torch.ones_like(input_ids).to(model.device),
+        past_key_values=past_key_values,
+        max_new_tokens=max_new_tokens,
+        pad_token_id=pad_token_id,
+        return_dict_in_generate=True,
+    )
+
+
+def generate_with_history(ai_pipeline, kv_cache, conversation_id, model_key, prompt,
+                          max_length=50, history_loader=None):
+    """
+    以對話快取的 past key/values 生成回覆，只需對本回合新增的 token 做 forward
+
+    Args:
+        ai_pipeline: Hugging Face text-generation pipeline
+        kv_cache: ConversationKVCache
+        conversation_id: 對話 ID
+        model_key: 模型識別（如 'en'/'zh'），換模型時快取失效
+        prompt: 本回合用戶輸入
+        max_length: 本回合輸入加生成的 token 上限（與 pipeline 的 max_length 相同語意）
+        history_loader: 快取未命中時回傳 [(sender, message), ...] 的函數，用於重建上下文
+    """
+    tokenizer = ai_pipeline.tokenizer
+    kwargs = _prepare_generation(ai_pipeline, kv_cache, conversation_id, model_key, prompt, max_length, history_loader)
+    with torch.no_grad():
+        output = ai_pipeline.model.generate(**kwargs)
+
+    sequences = output.sequences.cpu()
+    kv_cache.put(conversation_id, _CachedContext(model_key, sequences, output.past_key_values))
+
+    # 與 pipeline 的 generated_text 一致：回覆以原始輸入開頭
+    continuation = tokenizer.decode(sequences[0, kwargs["input_ids"].shape[1]:], skip_special_tokens=True)
+    return prompt + continuation
+
+
+def stream_with_history(ai_pipeline, kv_cache, conversation_id, model_key, prompt,
+                        max_length=50, history_loader=None):
+    """
+    串流版本的 generate_with_history：逐段 yield 生成的文字（不含本回合輸入），
+    生成完成後才更新對話快取（中途停止讀取時此對話的快取會被捨棄）
+    """
+    from streaming import stream_generate
+
+    kwargs = _prepare_generation(ai_pipeline, kv_cache, conversation_id, model_key, prompt, max_length, history_loader)
+
+    def on_complete(output):
+        kv_cache.put(conversation_id, _CachedContext(model_key, output.sequences.cpu(), output.past_key_values))
+
+    yield from stream_generate(ai_pipeline.tokenizer, ai_pipeline.model, on_complete=on_complete, **kwargs)
+
+
+# 示例
+if __name__ == "__main__":
+    from transformers import pipeline
+
+    zh_pipeline = pipeline("text-generation", model="uer/gpt2-chinese-cluecorpussmall", device="cpu")
+    cache = ConversationKVCache(max_mb=64)
+    for turn in ["你好", "圖書館幾點開門", "謝謝"]:
+        print(generate_with_history(zh_pipeline, cache, "demo", "zh", turn))
+        print(cache.stats())
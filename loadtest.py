@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+#12_loadtest:並發負載測試
+# 比較 Flask (app.py, 預設 port 5000) 與 ASGI (asgi_app.py, 預設 port 5001) 在不同並發數下的吞吐量
+# 用法: python loadtest.py --url http://localhost:5000 --url http://localhost:5001 --concurrency 1 8 32 128
+
+
+async def create_conversation(client, base_url):
+    response = await client.post(f"{base_url}/api/new_conversation", json={"name": "loadtest"})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def worker(client, base_url, conversation_id, endpoint, message, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            if endpoint == "message":
+                response = await client.post(
+                    f"{base_url}/api/message",
+                    json={"message": message, "conversation_id": conversation_id},
+                )
+            else:
+                response = await client.get(f"{base_url}/api/conversations")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(1)
+
+
+async def run_level(base_url, concurrency, duration, endpoint, message):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        conversation_id = await create_conversation(client, base_url)
+        latencies, errors = [], []
+        deadline = time.monotonic() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            worker(client, base_url, conversation_id, endpoint, message, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    if latencies:
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+    else:
+        p50 = p95 = float("nan")
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": p50,
+        "p95_ms": p95,
+    }
+
+
+async def main(args):
+    for base_url in args.url:
+        print(f"== {base_url} ({args.endpoint})")
+        print(f"{'並發':>6} {'請求數':>8} {'錯誤':>6} {'req/s':>9} {'p50(ms)':>10} {'p95(ms)':>10}")
+        for concurrency in args.concurrency:
+            result = await run_level(base_url, concurrency, args.duration, args.endpoint, args.message)
+            print(f"{result['concurrency']:>6} {result['requests']:>8} {result['errors']:>6} "
+                  f"{result['rps']:>9.2f} {result['p50_ms']:>10.1f} {result['p95_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NTNU Chatbot 並發負載測試")
+    parser.add_argument("--url", action="append", default=None, help="伺服器位址，可重複指定以比較多個伺服器")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=20.0, help="每個並發等級的持續秒數")
+    parser.add_argument("--endpoint", choices=["message", "conversations"], default="message")
+    parser.add_argument("--message", default="圖書館開放時間?")
+    args = parser.parse_args()
+    if not args.url:
+        args.url = ["http://localhost:5000", "http://localhost:5001"]
+    asyncio.run(main(args))
@@ -0,0 +1,152 @@
+import html
+import re
+
+from sqlalchemy import text
+
+#21_message_search:以全文索引搜尋聊天記錄
+# MySQL 上使用 InnoDB FULLTEXT 索引搭配 ngram parser（中文不需斷詞），
+# 索引由 migrations/0003_fulltext_indexes.py 建立，寫入訊息時由 InnoDB 自動增量維護；
+# 依相關度排序並分頁，回傳標示關鍵字的摘要。
+# 其他資料庫（例如開發用的 SQLite）退回 LIKE 查詢
+NGRAM_TOKEN_SIZE = 2  # 與 MySQL 的 ngram_token_size 預設值一致
+MAX_LIMIT = 100
+SNIPPET_CHARS = 80
+
+# 布林模式的運算子，使用者輸入中出現時一律移除
+_BOOLEAN_OPERATORS_RE = re.compile(r'[+\-<>()~*"@]+')
+
+
+def split_terms(query):
+    return [term for term in _BOOLEAN_OPERATORS_RE.sub(" ", query.lower()).split() if term]
+
+
+# 轉成 BOOLEAN MODE 查詢：每個詞都必須出現；
+# 比 ngram 短的詞（例如單一中文字）只能以前綴查詢
+def to_boolean_query(terms):
+    parts = []
+    for term in terms:
+        if len(term) < NGRAM_TOKEN_SIZE:
+            parts.append(f"+{term}*")
+        else:
+            parts.append(f'+"{term}"')
+    return " ".join(parts)
+
+
+# 訊息內容或所屬對話名稱符合即算命中，兩者分別走各自的全文索引再合併，
+# 同一則訊息取較高的分數
+_MYSQL_SEARCH_SQL = """
+SELECT m.id, m.message, m.sender, m.conversation_id, m.timestamp,
+       c.name AS conversation_name, hits.score
+FROM (
+    SELECT id, MAX(score) AS score FROM (
+        SELECT id, MATCH(message) AGAINST(:q IN BOOLEAN MODE) AS score
+        FROM chat_messages
+        WHERE MATCH(message) AGAINST(:q IN BOOLEAN MODE)
+        UNION ALL
+        SELECT cm.id, MATCH(cv.name) AGAINST(:q IN BOOLEAN MODE) AS score
+        FROM conversations cv
+        JOIN chat_messages cm ON cm.conversation_id = cv.id
+        WHERE MATCH(cv.name) AGAINST(:q IN BOOLEAN MODE)
+    ) scored
+    GROUP BY id
+    ORDER BY score DESC, id DESC
+    LIMIT :limit OFFSET :offset
+) hits
+JOIN chat_messages m ON m.id = hits.id
+JOIN conversations c ON c.id = m.conversation_id
+ORDER BY hits.score DESC, m.id DESC
+"""
+
+_LIKE_SEARCH_SQL = """
+SELECT m.id, m.message, m.sender, m.conversation_id, m.timestamp,
+       c.name AS conversation_name, NULL AS score
+FROM chat_messages m
+JOIN conversations c ON c.id = m.conversation_id
+WHERE {conditions}
+ORDER BY m.id DESC
+LIMIT :limit OFFSET :offset
+"""
+
+
+def build_search_statement(dialect_name, terms, limit, offset):
+    """
+    回傳 (statement, params)，同步與非同步連線都可直接執行
+
+    多取一筆用來判斷是否還有下一頁
+    """
+    params = {"limit": limit + 1, "offset": offset}
+    if dialect_name == "mysql":
+        params["q"] = to_boolean_query(terms)
+        return text(_MYSQL_SEARCH_SQL), params
+
+    conditions = []
+    for i, term in enumerate(terms):
+        params[f"t{i}"] = f"%{term}%"
+        conditions.append(f"(LOWER(m.message) LIKE :t{i} OR LOWER(c.name) LIKE :t{i})")
+    return text(_LIKE_SEARCH_SQL.format(conditions=" AND ".join(conditions))), params
+
+
+# 取第一個關鍵字附近的片段，並以 <mark> 標示所有關鍵字（其餘內容已 HTML escape）
+def make_snippet(message, terms, max_chars=SNIPPET_CHARS):
+    lowered = message.lower()
+    positions = [pos for pos in (lowered.find(term) for term in terms) if pos >= 0]
+    start = 0
+    if positions and len(message) > max_chars:
+        start = max(0, min(positions) - max_chars // 4)
+    end = min(len(message), start + max_chars)
+    snippet = message[start:end]
+
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(snippet[last:]))
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(message) else ""
+    return prefix + "".join(parts) + suffix
+
+
+def parse_paging(limit, page, default_limit=20):
+    try:
+        limit = int(limit) if limit else default_limit
+        page = int(page) if page else 1
+    except ValueError:
+        limit, page = default_limit, 1
+    limit = min(max(limit, 1), MAX_LIMIT)
+    page = max(page, 1)
+    return limit, page
+
+
+def format_results(rows, terms, limit, page):
+    rows = list(rows)
+    return {
+        'results': [{
+            'id': row.id,
+            'message': row.message,
+            'snippet': make_snippet(row.message, terms),
+            'sender': row.sender,
+            'conversation_id': row.conversation_id,
+            'conversation_name': row.conversation_name,
+            'score': float(row.score) if row.score is not None else None,
+            'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        } for row in rows[:limit]],
+        'page': page,
+        'limit': limit,
+        'has_more': len(rows) > limit,
+    }
+
+
+def search_messages(connection, query, limit=None, page=None):
+    """
+    在同步連線上搜尋，回傳 {'results', 'page', 'limit', 'has_more'}
+    """
+    terms = split_terms(query)
+    limit, page = parse_paging(limit, page)
+    if not terms:
+        return format_results([], terms, limit, page)
+    statement, params = build_search_statement(connection.dialect.name, terms, limit, (page - 1) * limit)
+    return format_results(connection.execute(statement, params), terms, limit, page)
@@ -0,0 +1,135 @@
+import argparse
+import importlib
+import os
+import re
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+#23_migrate:執行資料庫結構遷移與檢查熱門查詢的執行計畫
+# 用法:
+#   python migrate.py            套用尚未執行的遷移
+#   python migrate.py status     列出每個遷移的狀態
+#   python migrate.py check      以 EXPLAIN 確認熱門查詢有使用索引，不符時以非 0 結束
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_MIGRATION_FILE_RE = re.compile(r"^(\d{4})_\w+\.py$")
+
+
+# 依版本號排序列出遷移，回傳 [(version, module_name)]
+def discover_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), "migrations." + filename[:-3]))
+    return migrations
+
+
+def ensure_version_table(connection):
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """))
+
+
+def applied_versions(connection):
+    return {row.version for row in connection.execute(text("SELECT version FROM schema_version"))}
+
+
+def upgrade(engine):
+    with engine.begin() as connection:
+        ensure_version_table(connection)
+        applied = applied_versions(connection)
+
+    for version, module_name in discover_migrations():
+        if version in applied:
+            continue
+        module = importlib.import_module(module_name)
+        print(f"套用 {module_name}: {module.DESCRIPTION}")  # 添加日誌
+        # 每個遷移獨立一個交易，完成後才記錄版本
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            connection.execute(text(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"
+            ), {"version": version, "name": module_name.split(".", 1)[1], "applied_at": datetime.utcnow()})
+
+
+def status(engine):
+    with engine.begin() as connection:
+        ensure_version_table(connection)
+        applied = applied_versions(connection)
+    for version, module_name in discover_migrations():
+        module = importlib.import_module(module_name)
+        state = "已套用" if version in applied else "未套用"
+        print(f"{version:04d} {state} {module.DESCRIPTION}")
+
+
+# 熱門查詢與預期使用的索引
+HOT_QUERIES = [
+    (
+        "對話歷史（keyset 分頁）",
+        "SELECT * FROM chat_messages WHERE conversation_id = :conversation_id AND id < :before_id "
+        "ORDER BY id DESC LIMIT 51",
+        {"conversation_id": "00000000-0000-0000-0000-000000000000", "before_id": 2 ** 31 - 1},
+        {"idx_chat_messages_conversation_id"},
+    ),
+    (
+        "對話列表",
+        "SELECT id, name, created_at FROM conversations ORDER BY created_at DESC, id DESC LIMIT 21",
+        {},
+        {"idx_conversations_created_at"},
+    ),
+    (
+        "訊息全文搜尋",
+        "SELECT id FROM chat_messages WHERE MATCH(message) AGAINST(:q IN BOOLEAN MODE)",
+        {"q": '+"圖書館"'},
+        {"ft_chat_messages_message"},
+    ),
+]
+
+
+# 檢查前更新統計資訊的資料表
+ANALYZED_TABLES = ["chat_messages", "conversations"]
+
+
+def check(engine):
+    """
+    以 EXPLAIN 檢查每個熱門查詢實際使用（key）預期的索引且不需 filesort，回傳失敗的查詢數
+    """
+    failures = 0
+    with engine.connect() as connection:
+        # 先更新統計資訊，避免優化器依過期的資料量估計而選擇全表掃描
+        for table in ANALYZED_TABLES:
+            connection.execute(text(f"ANALYZE TABLE {table}")).all()
+        for label, sql, params, expected_keys in HOT_QUERIES:
+            rows = connection.execute(text("EXPLAIN " + sql), params).mappings().all()
+            plan = rows[0]
+            extra = plan.get("Extra") or ""
+            key = plan.get("key")
+            ok = key in expected_keys and "filesort" not in extra
+            failures += not ok
+            print(f"[{'OK' if ok else 'FAIL'}] {label}: type={plan.get('type')} key={plan.get('key')} "
+                  f"possible_keys={plan.get('possible_keys')} extra={extra}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="資料庫結構遷移")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status", "check"])
+    args = parser.parse_args()
+
+    from app import app, db
+
+    with app.app_context():
+        if db.engine.dialect.name != "mysql":
+            sys.exit(f"遷移僅支援 MySQL，目前為 {db.engine.dialect.name}")
+        if args.command == "upgrade":
+            upgrade(db.engine)
+        elif args.command == "status":
+            status(db.engine)
+        else:
+            sys.exit(1 if check(db.engine) else 0)
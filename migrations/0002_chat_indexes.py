@@ -0,0 +1,10 @@
+from migrations import add_index
+
+DESCRIPTION = "歷史記錄與對話列表的複合索引"
+
+
+def upgrade(connection):
+    # 對話歷史以 (conversation_id, id) 做 keyset 分頁，索引順序與查詢一致，不需 filesort
+    add_index(connection, "chat_messages", "idx_chat_messages_conversation_id", ["conversation_id", "id"])
+    # 對話列表依 created_at 由新到舊排序並分頁
+    add_index(connection, "conversations", "idx_conversations_created_at", ["created_at", "id"])
@@ -0,0 +1,16 @@
+from sqlalchemy import text
+
+from migrations import add_index
+
+DESCRIPTION = "訊息內容與對話名稱的 ngram 全文索引（不使用 stopword）"
+
+
+def upgrade(connection):
+    # InnoDB 預設的英文 stopword 清單（a、about、is、the、will…）會在建立索引時套用到 ngram token 上，
+    # 含有這些字元組合的 token（例如 "is"、"be"）不會被索引，搜尋短英文詞時找不到；
+    # 設定在建立索引時生效，只影響本連線
+    connection.execute(text("SET SESSION innodb_ft_enable_stopword = OFF"))
+    add_index(connection, "chat_messages", "ft_chat_messages_message", ["message"],
+              kind="FULLTEXT INDEX", parser="ngram", lock="SHARED")
+    add_index(connection, "conversations", "ft_conversations_name", ["name"],
+              kind="FULLTEXT INDEX", parser="ngram", lock="SHARED")
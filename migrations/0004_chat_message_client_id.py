@@ -0,0 +1,10 @@
+from migrations import add_column, add_index
+
+DESCRIPTION = "chat_messages.client_message_id 與唯一索引（write-behind 重播去重）"
+
+
+def upgrade(connection):
+    add_column(connection, "chat_messages", "client_message_id", "VARCHAR(36) NULL")
+    # 既有訊息的值為 NULL，唯一索引允許多個 NULL
+    add_index(connection, "chat_messages", "uq_chat_messages_client_message_id", ["client_message_id"],
+              kind="UNIQUE INDEX")
@@ -0,0 +1,45 @@
+from sqlalchemy import text
+
+#23_migrations:版本化的資料庫結構變更
+# 每個 NNNN_<說明>.py 提供 DESCRIPTION 與 upgrade(connection)，由 migrate.py 依版本號依序執行。
+# MySQL 的 DDL 會隱式提交，無法整批回滾，因此每個步驟都先檢查是否已存在，
+# 中途失敗後重新執行也是安全的
+
+
+def index_exists(connection, table, index_name):
+    return connection.execute(text(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME = :index_name LIMIT 1"
+    ), {"table": table, "index_name": index_name}).first() is not None
+
+
+def add_index(connection, table, index_name, columns, kind="INDEX", parser=None, lock="NONE"):
+    """
+    以 online DDL 新增索引：ALGORITHM=INPLACE 不重建資料表，
+    LOCK=NONE 讓建立索引期間仍可讀寫（FULLTEXT 索引最多只支援 LOCK=SHARED）
+    """
+    if index_exists(connection, table, index_name):
+        return False
+    with_parser = f" WITH PARSER {parser}" if parser else ""
+    connection.execute(text(
+        f"ALTER TABLE {table} ADD {kind} {index_name} ({', '.join(columns)}){with_parser}, "
+        f"ALGORITHM=INPLACE, LOCK={lock}"
+    ))
+    return True
+
+
+def column_exists(connection, table, column):
+    return connection.execute(text(
+        "SELECT 1 FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column LIMIT 1"
+    ), {"table": table, "column": column}).first() is not None
+
+
+# 新增可為 NULL 的欄位不需重建資料表，建立期間仍可讀寫
+def add_column(connection, table, column, definition):
+    if column_exists(connection, table, column):
+        return False
+    connection.execute(text(
+        f"ALTER TABLE {table} ADD COLUMN {column} {definition}, ALGORITHM=INPLACE, LOCK=NONE"
+    ))
+    return True
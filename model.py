@@ -20,6 +20,13 @@ class LanguageModel(nn.Module):
         out, _ = self.rnn(x)
         out = self.fc(out[:, -1, :])
         return out
+
+    # 增量解碼：帶入上一步的 LSTM 狀態 (h, c)，只需處理新輸入的 token
+    def forward_step(self, x, hidden=None):
+        x = self.embedding(x)
+        out, hidden = self.rnn(x, hidden)
+        out = self.fc(out[:, -1, :])
+        return out, hidden
     
     def get_config(self):
         return {
@@ -0,0 +1,177 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+#13_model_registry:按需載入模型並在閒置時釋放
+# 估算模型佔用的記憶體（參數 + buffer），單位 bytes
+def estimate_model_bytes(ai_pipeline):
+    model = getattr(ai_pipeline, "model", ai_pipeline)
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _Entry:
+    def __init__(self, value, size_bytes):
+        self.value = value
+        self.size_bytes = size_bytes
+        self.in_use = 0
+        self.pinned = False
+        self.last_used = time.monotonic()
+
+
+class ModelRegistry:
+    def __init__(self, loaders, memory_budget_mb=0, idle_timeout=600, reap_interval=30):
+        """
+        Args:
+            loaders: 模型名稱 -> 載入函數（無參數，回傳 pipeline）
+            memory_budget_mb: 已載入模型的記憶體上限，0 表示不限制
+            idle_timeout: 閒置超過此秒數的模型會被釋放，0 表示不釋放
+            reap_interval: 背景檢查閒置模型的間隔秒數
+        """
+        self.loaders = dict(loaders)
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self._entries = OrderedDict()  # 依最近使用排序（LRU 在前）
+        self._init_threading()
+        # fork 出的子行程不會繼承執行緒，需重建鎖與背景執行緒
+        os.register_at_fork(after_in_child=self._init_threading)
+
+    def _init_threading(self):
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.loaders}
+        if self.idle_timeout and self.reap_interval:
+            reaper = threading.Thread(target=self._reap_loop, args=(self.reap_interval,), name="model-reaper", daemon=True)
+            reaper.start()
+
+    # 取得模型並標記使用中，離開 with 區塊後才允許被釋放
+    @contextmanager
+    def use(self, name):
+        entry = self._acquire(name)
+        try:
+            yield entry.value
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def _acquire(self, name):
+        if name not in self.loaders:
+            raise KeyError(f"未知的模型: {name}")
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry.in_use += 1
+                self._entries.move_to_end(name)
+                return entry
+
+        # 同一模型只允許一個執行緒載入，其他執行緒等待結果
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    entry.in_use += 1
+                    self._entries.move_to_end(name)
+                    return entry
+
+            started = time.perf_counter()
+            value = self.loaders[name]()
+            entry = _Entry(value, estimate_model_bytes(value))
+            print(f"模型 {name} 加載完成: {entry.size_bytes / 1024 / 1024:.0f} MB, "
+                  f"{time.perf_counter() - started:.1f}s")  # 添加日誌
+
+            with self._lock:
+                entry.in_use += 1
+                self._entries[name] = entry
+                evicted = self._enforce_budget()
+            self._collect(evicted)
+            return entry
+
+    # 超出記憶體上限時依 LRU 順序釋放未使用中的模型，回傳被移除的項目（需持有 self._lock）
+    def _enforce_budget(self):
+        evicted = []
+        if not self.memory_budget:
+            return evicted
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        for name in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            entry = self._entries[name]
+            if entry.in_use or entry.pinned:
+                continue
+            total -= entry.size_bytes
+            evicted.append(self._evict(name))
+        if total > self.memory_budget:
+            print(f"警告: 使用中的模型超出記憶體上限 ({total / 1024 / 1024:.0f} MB)")
+        return evicted
+
+    # 只從註冊表移除（需持有 self._lock），實際釋放記憶體由 _collect 在鎖外進行
+    def _evict(self, name):
+        print(f"釋放模型: {name}")  # 添加日誌
+        return self._entries.pop(name)
+
+    # gc.collect() 可能耗時數百毫秒，在鎖外執行，避免阻塞其他請求取得模型
+    @staticmethod
+    def _collect(evicted):
+        if not evicted:
+            return
+        evicted.clear()
+        gc.collect()
+
+    def evict_idle(self):
+        if not self.idle_timeout:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = [name for name, entry in self._entries.items()
+                    if not entry.in_use and not entry.pinned and now - entry.last_used > self.idle_timeout]
+            evicted = [self._evict(name) for name in idle]
+        self._collect(evicted)
+
+    def _reap_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            self.evict_idle()
+
+    # 預先加載模型；pin=True 時模型常駐，不會被閒置或記憶體上限釋放
+    def preload(self, *names, pin=False):
+        for name in names or self.loaders:
+            with self.use(name):
+                self._entries[name].pinned = pin
+
+    # 回傳目前已加載的模型（供 prefork 等需要直接操作權重的場景使用）
+    def loaded(self):
+        with self._lock:
+            return {name: entry.value for name, entry in self._entries.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'size_mb': round(entry.size_bytes / 1024 / 1024, 1),
+                    'in_use': entry.in_use,
+                    'pinned': entry.pinned,
+                    'idle_seconds': round(time.monotonic() - entry.last_used, 1),
+                } for name, entry in self._entries.items()
+            }
+
+
+# 示例
+if __name__ == "__main__":
+    from transformers import pipeline
+
+    registry = ModelRegistry({
+        "zh": lambda: pipeline("text-generation", model="uer/gpt2-chinese-cluecorpussmall", device="cpu"),
+    }, memory_budget_mb=1024, idle_timeout=5, reap_interval=1)
+
+    with registry.use("zh") as zh_pipeline:
+        print(zh_pipeline("你好", max_length=20)[0]['generated_text'])
+    print(registry.stats())
+    time.sleep(7)
+    print(registry.stats())
@@ -0,0 +1,103 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+
+#14_prefork:多行程共享模型權重
+# 主行程先加載模型再 fork 出 worker，權重頁面以 copy-on-write 方式在所有 worker 間共享，
+# 每個 worker 只需額外負擔推論時的 activation 記憶體
+# 用法: python prefork.py --workers 4 --port 5000
+
+
+# 將模型設為唯讀推論狀態，避免任何寫入觸發 copy-on-write 複製權重頁面
+def freeze_pipeline_weights(ai_pipeline):
+    model = ai_pipeline.model
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return model
+
+
+def serve_worker(sock, app, threads_per_worker):
+    import torch
+    from werkzeug.serving import make_server
+    from app import db
+
+    # 不沿用主行程的資料庫連線，各 worker 建立自己的連線池
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    # 避免多個 worker 各自開滿所有核心的 intra-op 執行緒
+    torch.set_num_threads(threads_per_worker)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    print(f"[worker {os.getpid()}] 開始服務 {host}:{port}")  # 添加日誌
+    server.serve_forever()
+
+
+def spawn_worker(sock, app, threads_per_worker):
+    pid = os.fork()
+    if pid == 0:
+        # 子行程：恢復預設訊號處理，由主行程負責管理
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            serve_worker(sock, app, threads_per_worker)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main(args):
+    from app import app, model_registry
+
+    # 主行程加載所有模型並常駐，fork 後由各 worker 共享
+    model_registry.preload(pin=True)
+    for name, ai_pipeline in model_registry.loaded().items():
+        freeze_pipeline_weights(ai_pipeline)
+    print(f"模型已於主行程加載: {model_registry.stats()}")  # 添加日誌
+
+    # 將目前所有物件移出 GC 追蹤，避免子行程的 GC 寫入物件標頭而複製頁面
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    threads_per_worker = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    workers = set()
+    for _ in range(args.workers):
+        workers.add(spawn_worker(sock, app, threads_per_worker))
+
+    def shutdown(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # 監控 worker，意外結束時重新 fork
+    while True:
+        pid, status = os.wait()
+        if pid in workers:
+            workers.discard(pid)
+            print(f"worker {pid} 結束 (status={status})，重新啟動")  # 添加日誌
+            workers.add(spawn_worker(sock, app, threads_per_worker))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以 prefork 模式啟動並共享模型權重")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=0, help="每個 worker 的 torch 執行緒數，0 表示自動分配")
+    main(parser.parse_args())
@@ -0,0 +1,123 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+#16_response_cache:相同問題直接回傳快取的回覆
+# 具 TTL 與容量上限的 LRU 快取
+class TTLCache:
+    def __init__(self, max_size=10000, ttl=3600):
+        """
+        Args:
+            max_size: 最多保存的項目數，超出時淘汰最久未使用的項目
+            ttl: 項目存活秒數，0 表示不過期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT_RE = re.compile(r'[\s?？!！.。~～…]+$')
+
+
+# 正規化 prompt：全形轉半形、轉小寫、合併空白、去除結尾問號等標點
+def normalize_prompt(prompt):
+    text = unicodedata.normalize("NFKC", prompt).lower()
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return _TRAILING_PUNCT_RE.sub('', text)
+
+
+class ResponseCache:
+    def __init__(self, max_size=10000, ttl=3600):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    # 取樣生成（do_sample）每次結果不同，不適合快取
+    @staticmethod
+    def is_cacheable(generate_kwargs):
+        return not generate_kwargs.get("do_sample", False)
+
+    @staticmethod
+    def make_key(prompt, lang, model_name, generate_kwargs):
+        params = tuple(sorted((k, repr(v)) for k, v in generate_kwargs.items()))
+        return (normalize_prompt(prompt), lang, model_name, params)
+
+    def get(self, prompt, lang, model_name, generate_kwargs):
+        if not self.is_cacheable(generate_kwargs):
+            return None
+        item = self._cache.get(self.make_key(prompt, lang, model_name, generate_kwargs))
+        if item is None:
+            return None
+        cached_prompt, reply = item
+        # 回覆以原始輸入開頭，換成本次的輸入以免顯示別人的寫法
+        if reply.startswith(cached_prompt):
+            reply = prompt + reply[len(cached_prompt):]
+        return reply
+
+    def set(self, prompt, lang, model_name, generate_kwargs, reply):
+        if not self.is_cacheable(generate_kwargs):
+            return
+        self._cache.set(self.make_key(prompt, lang, model_name, generate_kwargs), (prompt, reply))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# 示例
+if __name__ == "__main__":
+    cache = ResponseCache(max_size=2, ttl=60)
+    kwargs = {"max_length": 50}
+    cache.set("圖書館開放時間?", "zh", "uer/gpt2-chinese-cluecorpussmall", kwargs, "早上八點")
+    print(cache.get("  圖書館開放時間？ ", "zh", "uer/gpt2-chinese-cluecorpussmall", kwargs))
+    print(cache.get("How to apply for dorm", "en", "facebook/opt-350m", kwargs))
+    print(cache.stats())
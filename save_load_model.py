@@ -1,11 +1,52 @@
+import os
+
 import torch
 
-# 保存模型和詞彙表大小
-def save_model(model, vocab_size, file_path):
-    torch.save({
+from tokenization import PAD_TOKEN, UNK_TOKEN, subword_tokenizer_from_str
+
+CHECKPOINT_VERSION = 2
+
+
+# 詞級 tokenizer 的預設設定（與 tokenization.text_to_tokens 的行為一致）
+def word_tokenizer_settings(seq_length=20):
+    return {
+        'type': 'word',
+        'lowercase': True,
+        'pad_token': PAD_TOKEN,
+        'unk_token': UNK_TOKEN,
+        'seq_length': seq_length,
+    }
+
+# subword tokenizer 的設定，tokenizer 本身序列化成 JSON 一併存入 checkpoint
+def subword_tokenizer_settings(tokenizer, seq_length=20):
+    return {
+        'type': 'subword',
+        'lowercase': True,
+        'pad_token': PAD_TOKEN,
+        'unk_token': UNK_TOKEN,
+        'seq_length': seq_length,
+        'tokenizer_json': tokenizer.to_str(),
+    }
+
+# 保存模型和詞彙表大小；提供 vocab 時將詞彙表、反向詞彙表、模型設定與 tokenizer 設定一併存入，
+# 生成時只需讀取這個檔案，不必重新解析語料
+def save_model(model, vocab_size, file_path, vocab=None, tokenizer=None):
+    checkpoint = {
         'model_state_dict': model.state_dict(),
         'vocab_size': vocab_size
-    }, file_path)
+    }
+    if vocab is not None:
+        checkpoint.update({
+            'version': CHECKPOINT_VERSION,
+            'config': model.get_config(),
+            'vocab': dict(vocab),
+            'inv_vocab': {idx: word for word, idx in vocab.items()},
+            'tokenizer': tokenizer or word_tokenizer_settings(),
+        })
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    torch.save(checkpoint, file_path)
 
 # 加载模型和詞彙表大小
 def load_model(model, file_path):
@@ -13,6 +54,26 @@ def load_model(model, file_path):
     model.load_state_dict(checkpoint['model_state_dict'])
     return checkpoint['vocab_size']
 
+# 直接從 checkpoint 還原可用於生成的模型，回傳 (model, vocab, inv_vocab, tokenizer_settings)；
+# subword 模型的 tokenizer_settings['tokenizer'] 為已還原的 tokenizer，可直接傳給 generate_text
+def load_for_inference(file_path, device=None):
+    from model import LanguageModel
+
+    checkpoint = torch.load(file_path, map_location='cpu', weights_only=True)
+    if 'config' not in checkpoint or 'vocab' not in checkpoint:
+        raise ValueError(f"{file_path} 沒有包含詞彙表與模型設定，請以 save_model(..., vocab=vocab) 重新保存")
+
+    config = checkpoint['config']
+    model = LanguageModel(config['vocab_size'], config['embed_size'], config['hidden_size'])
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.to(device or 'cpu')
+    model.eval()
+
+    settings = dict(checkpoint['tokenizer'])
+    if settings['type'] == 'subword':
+        settings['tokenizer'] = subword_tokenizer_from_str(settings.pop('tokenizer_json'))
+    return model, checkpoint['vocab'], checkpoint['inv_vocab'], settings
+
 # 示例
 if __name__ == "__main__":
     from model import LanguageModel
@@ -0,0 +1,165 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from response_cache import normalize_prompt
+
+#17_semantic_cache:以向量相似度匹配換句話說的問題
+# 預設嵌入器：字元 n-gram 雜湊向量（適用中英文，無需額外模型）。
+# 只衡量字面重疊，無法分辨語意：「宿舍怎麼申請」與「宿舍怎麼退宿」、
+# "library open" 與 "library close" 的相似度都接近真正的換句話說，
+# 因此門檻預設很高，實際上只匹配標點、語助詞、空白等字面差異；要匹配真正的換句話說請改用 TransformerEmbedder
+class HashingEmbedder:
+    default_threshold = 0.95
+
+    def __init__(self, dim=1024, ngram_range=(1, 2)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def __call__(self, text):
+        text = normalize_prompt(text).replace(' ', '')
+        vector = np.zeros(self.dim, dtype=np.float32)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                bucket = zlib.crc32(text[i:i + n].encode("utf-8")) % self.dim
+                vector[bucket] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+# 句向量模型嵌入器：transformers 模型的 mean pooling，預設為中英文皆可的多語言模型
+class TransformerEmbedder:
+    default_threshold = 0.9
+
+    def __init__(self, model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", device="cpu"):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(device).eval()
+        self.device = device
+
+    def __call__(self, text):
+        torch = self._torch
+        inputs = self.tokenizer(normalize_prompt(text), return_tensors="pt", truncation=True).to(self.device)
+        with torch.no_grad():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        vector = ((hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9))[0]
+        vector = torch.nn.functional.normalize(vector, dim=0)
+        return vector.cpu().numpy().astype(np.float32)
+
+
+# 單一命名空間（語言 + 模型 + 生成參數）的向量索引，使用環狀緩衝區保存最近的項目
+class _VectorIndex:
+    def __init__(self, dim, max_size):
+        self.vectors = np.zeros((max_size, dim), dtype=np.float32)
+        self.expires_at = np.zeros(max_size, dtype=np.float64)
+        self.values = [None] * max_size
+        self.size = 0
+        self.cursor = 0
+
+    def search(self, query, now):
+        if not self.size:
+            return -1, 0.0
+        scores = self.vectors[:self.size] @ query
+        # 過期項目不參與比較
+        scores[self.expires_at[:self.size] < now] = -1.0
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def add(self, vector, value, expires_at):
+        slot = self.cursor
+        self.vectors[slot] = vector
+        self.expires_at[slot] = expires_at
+        self.values[slot] = value
+        self.cursor = (self.cursor + 1) % len(self.values)
+        self.size = min(self.size + 1, len(self.values))
+
+
+class SemanticCache:
+    def __init__(self, embedder=None, threshold=None, max_size=5000, ttl=3600):
+        """
+        Args:
+            embedder: 將文字轉為已正規化向量的函數，預設為 HashingEmbedder
+            threshold: 餘弦相似度達到此值才視為命中，None 時使用嵌入器的 default_threshold
+            max_size: 每個命名空間最多保存的項目數
+            ttl: 項目存活秒數
+        """
+        self.embedder = embedder or HashingEmbedder()
+        if threshold is None:
+            threshold = getattr(self.embedder, "default_threshold", HashingEmbedder.default_threshold)
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._lookup_seconds = 0.0
+
+    @staticmethod
+    def _namespace(lang, model_name, generate_kwargs):
+        return (lang, model_name, tuple(sorted((k, repr(v)) for k, v in generate_kwargs.items())))
+
+    def get(self, prompt, lang, model_name, generate_kwargs):
+        if generate_kwargs.get("do_sample", False):
+            return None
+        started = time.perf_counter()
+        query = self.embedder(prompt)
+        with self._lock:
+            index = self._indexes.get(self._namespace(lang, model_name, generate_kwargs))
+            slot, score = index.search(query, time.monotonic()) if index else (-1, 0.0)
+            hit = slot >= 0 and score >= self.threshold
+            value = index.values[slot] if hit else None
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._lookup_seconds += time.perf_counter() - started
+        if value is None:
+            return None
+        cached_prompt, reply = value
+        # 回覆以原始輸入開頭，換成本次的輸入
+        if reply.startswith(cached_prompt):
+            reply = prompt + reply[len(cached_prompt):]
+        return reply
+
+    def set(self, prompt, lang, model_name, generate_kwargs, reply):
+        if generate_kwargs.get("do_sample", False):
+            return
+        vector = self.embedder(prompt)
+        namespace = self._namespace(lang, model_name, generate_kwargs)
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = _VectorIndex(len(vector), self.max_size)
+            index.add(vector, (prompt, reply), time.monotonic() + self.ttl if self.ttl else np.inf)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': sum(index.size for index in self._indexes.values()),
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'avg_lookup_ms': round(self._lookup_seconds / total * 1000, 3) if total else 0.0,
+            }
+
+
+# 示例
+if __name__ == "__main__":
+    cache = SemanticCache()
+    kwargs = {"max_length": 50}
+    cache.set("圖書館開放時間?", "zh", "gpt2-chinese", kwargs, "圖書館開放時間?早上八點")
+    print(cache.get("圖書館開放時間？", "zh", "gpt2-chinese", kwargs))
+    print(cache.get("宿舍怎麼申請", "zh", "gpt2-chinese", kwargs))
+    print(cache.stats())
@@ -3,10 +3,15 @@ USE chat_db;
 SHOW TABLES;
 
 -- 聊天機器人資料庫
+-- 既有資料庫請改用 python migrate.py 套用 migrations/ 中的變更（會記錄在 schema_version）
+-- ngram 全文索引不使用 stopword，需在建立資料表前於同一連線關閉
+SET SESSION innodb_ft_enable_stopword = OFF;
 CREATE TABLE conversations (
     id VARCHAR(36) PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_conversations_created_at (created_at, id),
+    FULLTEXT INDEX ft_conversations_name (name) WITH PARSER ngram
 );
 
 CREATE TABLE chat_messages (
@@ -15,8 +20,15 @@ CREATE TABLE chat_messages (
     sender VARCHAR(50) NOT NULL,
     message TEXT NOT NULL,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+    client_message_id VARCHAR(36) NULL,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id),
+    INDEX idx_chat_messages_conversation_id (conversation_id, id),
+    UNIQUE INDEX uq_chat_messages_client_message_id (client_message_id),
+    FULLTEXT INDEX ft_chat_messages_message (message) WITH PARSER ngram
 );
+
+-- 檢查對話歷史的 keyset 分頁是否使用索引
+EXPLAIN SELECT * FROM chat_messages WHERE conversation_id = 'x' AND id < 100 ORDER BY id DESC LIMIT 51;
 SHOW TABLES;
 SELECT * FROM conversations;
 SELECT * FROM chat_messages;
\ No newline at end of file
@@ -10,18 +10,37 @@ $(document).ready(function () {
   const searchInput = $('input[placeholder="搜尋..."]');
 
   let currentConversationId = null;
+  // 歷史記錄分頁狀態：下一次要載入的游標、是否還有更舊的訊息、是否正在載入
+  let historyCursor = null;
+  let historyHasMore = false;
+  let historyLoading = false;
 
-  // 加載對話列表
-  function loadConversations() {
+  // 加載對話列表（分頁），cursor 為 null 時重新載入第一頁，否則接在列表後面
+  function loadConversations(cursor = null) {
     $.ajax({
       url: '/api/conversations',
       method: 'GET',
-      success: function (conversations) {
-        chatList.empty();
-        conversations.forEach(function (conv) {
+      data: cursor ? { cursor: cursor } : {},
+      success: function (page) {
+        if (!cursor) {
+          chatList.empty();
+        }
+        page.conversations.forEach(function (conv) {
           const newChatItem = createChatListItem(conv);
           chatList.append(newChatItem);
         });
+
+        // 還有更早的對話時顯示「載入更多」
+        $('.load-more-conversations').remove();
+        if (page.has_more) {
+          chatList.after(
+            $('<button>').addClass('btn btn-link w-100 load-more-conversations')
+              .text('載入更多對話')
+              .on('click', function () {
+                loadConversations(page.next_cursor);
+              })
+          );
+        }
       },
       error: function (error) {
         console.error('Error loading conversations:', error);
@@ -86,7 +105,7 @@ $(document).ready(function () {
           appendUserMessage(message);
           chatInput.val('');
           scrollToBottom();
-          sendMessageToServer(message, conversation.id);
+          streamMessageToServer(message, conversation.id);
         }
       },
       error: function (error) {
@@ -115,38 +134,151 @@ $(document).ready(function () {
     });
   }
 
+  // 以 SSE 串流方式發送消息，邊生成邊顯示 AI 回覆
+  function streamMessageToServer(message, conversationId) {
+    // 瀏覽器不支援串流時退回一般請求
+    if (!window.fetch || !window.ReadableStream || !window.TextDecoder) {
+      sendMessageToServer(message, conversationId);
+      return;
+    }
+
+    const botMessage = $('<div>').addClass('bg-light text-dark p-2 rounded');
+    const botMessageElement = $('<div>')
+      .addClass('d-flex justify-content-start mb-3')
+      .append(botMessage);
+    chatContent.append(botMessageElement);
+    scrollToBottom();
+
+    let replyText = '';
+
+    // 處理一則 SSE 事件
+    function handleEvent(rawEvent) {
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach(function (line) {
+        if (line.startsWith('event:')) {
+          eventName = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          data += line.slice(5).trim();
+        }
+      });
+      if (!data) {
+        return;
+      }
+      const payload = JSON.parse(data);
+      if (eventName === 'done') {
+        replyText = payload.reply;
+      } else if (eventName === 'error') {
+        console.error('Error:', payload.error);
+        return;
+      } else {
+        replyText += payload.token;
+      }
+      botMessage.text(replyText);
+      scrollToBottom();
+    }
+
+    fetch('/api/message_stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        message: message,
+        conversation_id: conversationId,
+      }),
+    }).then(function (response) {
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      function read() {
+        return reader.read().then(function (result) {
+          if (result.done) {
+            if (buffer.trim()) {
+              handleEvent(buffer);
+            }
+            return;
+          }
+          buffer += decoder.decode(result.value, { stream: true });
+          const events = buffer.split('\n\n');
+          buffer = events.pop();
+          events.forEach(handleEvent);
+          return read();
+        });
+      }
+
+      return read();
+    }).catch(function (error) {
+      console.error('Error:', error);
+    });
+  }
+
   // 設置活躍對話
   function setActiveChat(chatItem) {
     $('.list-group-item').removeClass('active');
     chatItem.addClass('active');
     currentConversationId = chatItem.attr('data-conversation-id');
+    historyCursor = null;
+    historyHasMore = false;
+
+    // 只載入最新一頁，較舊的訊息在往上捲動時才載入
+    loadChatHistory(currentConversationId, null);
 
+    if ($(window).width() < 767) {
+      sidebar.removeClass('show');
+    }
+  }
+
+  // 分頁載入歷史記錄：beforeId 為 null 時載入最新一頁，否則將較舊的訊息接在最上方
+  function loadChatHistory(conversationId, beforeId) {
+    historyLoading = true;
     $.ajax({
-      url: `/api/chat_history/${currentConversationId}`,
+      url: `/api/chat_history/${conversationId}`,
       method: 'GET',
-      success: function (messages) {
-        chatContent.empty();
-        placeholder.hide();
+      data: beforeId ? { before_id: beforeId } : {},
+      success: function (page) {
+        // 載入期間已切換到別的對話時忽略
+        if (conversationId !== currentConversationId) {
+          return;
+        }
 
-        messages.forEach(function (msg) {
-          if (msg.sender === 'user') {
-            appendUserMessage(msg.message);
-          } else {
-            appendBotMessage(msg.message);
-          }
+        const elements = page.messages.map(function (msg) {
+          return createMessageElement(msg.sender, msg.message);
         });
 
-        scrollToBottom();
+        if (beforeId === null) {
+          chatContent.empty();
+          placeholder.hide();
+          chatContent.append(elements);
+          scrollToBottom();
+        } else {
+          // 插入前後的高度差補回捲動位置，畫面停在原本閱讀的訊息
+          const previousHeight = chatContent[0].scrollHeight;
+          const previousTop = chatContent.scrollTop();
+          chatContent.prepend(elements);
+          chatContent.scrollTop(chatContent[0].scrollHeight - previousHeight + previousTop);
+        }
+
+        historyCursor = page.next_before_id;
+        historyHasMore = page.has_more;
       },
       error: function (error) {
         console.error('Error loading chat history:', error);
       },
+      complete: function () {
+        historyLoading = false;
+      },
     });
+  }
 
-    if ($(window).width() < 767) {
-      sidebar.removeClass('show');
+  // 捲動到接近頂端時載入較舊的訊息
+  chatContent.on('scroll', function () {
+    if (historyHasMore && !historyLoading && currentConversationId && chatContent.scrollTop() < 100) {
+      loadChatHistory(currentConversationId, historyCursor);
     }
-  }
+  });
 
   // 發送消息
   sendButton.on('click', function () {
@@ -210,27 +342,8 @@ $(document).ready(function () {
             chatInput.val(''); // 清空輸入框
             scrollToBottom(); // 滾動到底部
 
-            // 發送第一次問題到伺服器
-            $.ajax({
-              url: '/api/message',
-              method: 'POST',
-              contentType: 'application/json',
-              data: JSON.stringify({
-                message: message,
-                conversation_id: currentConversationId
-              }),
-              success: function (data) {
-                // 顯示 AI 回覆
-                const botMessageElement = $('<div>')
-                  .addClass('d-flex justify-content-start mb-3')
-                  .html(`<div class="bg-light text-dark p-2 rounded">${data.reply}</div>`);
-                chatContent.append(botMessageElement);
-                scrollToBottom(); // 滾動到底部
-              },
-              error: function (error) {
-                console.error('Error sending message:', error);
-              }
-            });
+            // 以串流方式發送到伺服器並顯示 AI 回覆
+            streamMessageToServer(message, currentConversationId);
           },
           error: function (error) {
             console.error('Error creating conversation:', error);
@@ -245,27 +358,8 @@ $(document).ready(function () {
         chatInput.val(''); // 清空輸入框
         scrollToBottom(); // 滾動到底部
 
-        // 發送消息到伺服器
-        $.ajax({
-          url: '/api/message',
-          method: 'POST',
-          contentType: 'application/json',
-          data: JSON.stringify({
-            message: message,
-            conversation_id: currentConversationId
-          }),
-          success: function (data) {
-            // 顯示 AI 回覆
-            const botMessageElement = $('<div>')
-              .addClass('d-flex justify-content-start mb-3')
-              .html(`<div class="bg-light text-dark p-2 rounded">${data.reply}</div>`);
-            chatContent.append(botMessageElement);
-            scrollToBottom(); // 滾動到底部
-          },
-          error: function (error) {
-            console.error('Error sending message:', error);
-          }
-        });
+        // 以串流方式發送到伺服器並顯示 AI 回覆
+        streamMessageToServer(message, currentConversationId);
       }
     }
   });
@@ -369,14 +463,18 @@ $(document).ready(function () {
   });
 
   // 關鍵字搜尋
-  // 即時搜尋功能
+  // 即時搜尋功能（停止輸入一小段時間後才查詢，避免每個按鍵都送出請求）
+  let searchTimer = null;
   searchInput.on('input', function () {
     const searchText = $(this).val().toLowerCase().trim();
-    performSearch(searchText);
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(function () {
+      performSearch(searchText);
+    }, 250);
   });
 
-  // 執行搜尋的函數
-  function performSearch(searchText) {
+  // 執行搜尋的函數，page 大於 1 時將結果接在目前列表後面
+  function performSearch(searchText, page = 1) {
     if (!searchText) {
       // 如果搜尋文字為空，顯示所有對話
       $('#chat-list .list-group-item').show();
@@ -384,25 +482,37 @@ $(document).ready(function () {
       return;
     }
 
-    // 搜尋左側對話列表
-    $('#chat-list .list-group-item').each(function () {
-      const chatName = $(this).find('.chat-name').text().toLowerCase();
-      $(this).toggle(chatName.includes(searchText));
-    });
+    if (page === 1) {
+      // 搜尋左側對話列表
+      $('#chat-list .list-group-item').each(function () {
+        const chatName = $(this).find('.chat-name').text().toLowerCase();
+        $(this).toggle(chatName.includes(searchText));
+      });
+    }
 
-    // 全域搜尋所有聊天記錄
+    // 全域搜尋所有聊天記錄（依相關度排序、分頁）
     $.ajax({
       url: '/api/search_messages',
       method: 'GET',
       data: {
-        query: searchText
+        query: searchText,
+        page: page,
+        limit: 20
       },
-      success: function (results) {
-        // 清空當前聊天內容
-        $('.chat-content').empty();
-        $('.chat-placeholder').hide();
+      success: function (data) {
+        // 輸入已改變時忽略過期的結果
+        if (searchInput.val().toLowerCase().trim() !== searchText) {
+          return;
+        }
+
+        $('.search-more').remove();
+        if (page === 1) {
+          // 清空當前聊天內容
+          $('.chat-content').empty();
+          $('.chat-placeholder').hide();
+        }
 
-        if (results.length === 0) {
+        if (page === 1 && data.results.length === 0) {
           $('.chat-content').append(
             $('<div>').addClass('text-center text-muted mt-3')
               .text('找不到符合的訊息')
@@ -411,7 +521,7 @@ $(document).ready(function () {
         }
 
         // 顯示搜尋結果
-        results.forEach(function (result) {
+        data.results.forEach(function (result) {
           const messageElement = $('<div>')
             .addClass('search-result mb-3')
             .append(
@@ -419,10 +529,10 @@ $(document).ready(function () {
                 .text(`來自對話: ${result.conversation_name}`)
             );
 
-          // 根據發送者設置不同的樣式
+          // 根據發送者設置不同的樣式；snippet 由後端 escape 並以 <mark> 標示關鍵字
           const messageContent = $('<div>')
             .addClass('p-2 rounded')
-            .text(result.message);
+            .html(result.snippet);
 
           if (result.sender === 'user') {
             messageContent.addClass('bg-primary text-white');
@@ -435,6 +545,17 @@ $(document).ready(function () {
           messageElement.append(messageContent);
           $('.chat-content').append(messageElement);
         });
+
+        // 還有更多結果時顯示「載入更多」
+        if (data.has_more) {
+          $('.chat-content').append(
+            $('<button>').addClass('btn btn-link w-100 search-more')
+              .text('載入更多結果')
+              .on('click', function () {
+                performSearch(searchText, page + 1);
+              })
+          );
+        }
       },
       error: function (error) {
         console.error('搜尋時發生錯誤:', error);
@@ -456,21 +577,27 @@ $(document).ready(function () {
     chatContent.scrollTop(chatContent[0].scrollHeight);
   }
 
+  // 建立訊息元素
+  function createMessageElement(sender, message) {
+    if (sender === 'user') {
+      return $('<div>')
+        .addClass('d-flex justify-content-end mb-3')
+        .html(`<div class="bg-primary text-white p-2 rounded">${message}</div>`);
+    }
+    return $('<div>')
+      .addClass('d-flex justify-content-start mb-3')
+      .html(`<div class="bg-light text-dark p-2 rounded">${message}</div>`);
+  }
+
   // 顯示用戶消息
   function appendUserMessage(message) {
-    const messageElement = $('<div>')
-      .addClass('d-flex justify-content-end mb-3')
-      .html(`<div class="bg-primary text-white p-2 rounded">${message}</div>`);
-    chatContent.append(messageElement);
+    chatContent.append(createMessageElement('user', message));
     scrollToBottom(); // 滾動到底部
   }
 
   // 顯示 AI 回覆
   function appendBotMessage(message) {
-    const botMessageElement = $('<div>')
-      .addClass('d-flex justify-content-start mb-3')
-      .html(`<div class="bg-light text-dark p-2 rounded">${message}</div>`);
-    chatContent.append(botMessageElement);
+    chatContent.append(createMessageElement('ai', message));
     scrollToBottom(); // 滾動到底部
   }
 
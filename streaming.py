@@ -0,0 +1,59 @@
+import json
+import threading
+
+#10_streaming:逐 token 串流輸出
+# 格式化一則 Server-Sent Events 訊息
+def sse_event(data, event=None):
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+# 在背景執行緒執行 model.generate，呼叫端邊生成邊取得新增的文字片段（不含輸入）；
+# 生成完成後以 generate 的回傳值呼叫 on_complete
+def stream_generate(tokenizer, model, on_complete=None, **generate_kwargs):
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    result = {}
+
+    def run_generate():
+        try:
+            result["output"] = model.generate(streamer=streamer, **generate_kwargs)
+        except Exception as e:
+            result["error"] = e
+            # 讓等待中的迭代器結束
+            streamer.end()
+
+    thread = threading.Thread(target=run_generate, daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    if on_complete is not None:
+        on_complete(result["output"])
+
+
+# 以 TextIteratorStreamer 串流 Hugging Face pipeline 的生成結果
+def stream_pipeline(ai_pipeline, prompt, max_length=50, truncation=True, **generate_kwargs):
+    """
+    在背景執行緒執行 model.generate，主執行緒邊生成邊 yield 新增的文字片段
+    """
+    tokenizer = ai_pipeline.tokenizer
+    model = ai_pipeline.model
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=truncation).to(model.device)
+    yield from stream_generate(tokenizer, model, **inputs, max_length=max_length, **generate_kwargs)
+
+
+# 示例
+if __name__ == "__main__":
+    from transformers import pipeline
+
+    zh_pipeline = pipeline("text-generation", model="uer/gpt2-chinese-cluecorpussmall", device="cpu")
+    for chunk in stream_pipeline(zh_pipeline, "你好"):
+        print(chunk, end="", flush=True)
+    print()
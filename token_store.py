@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+#18_token_store:將 token 序列存成二進位檔，訓練與生成時以 np.memmap 開啟
+# 檔案格式：
+#   <prefix>.<id>.bin  連續的 token id（uint16 或 uint32，little-endian），每次寫入使用新的檔名
+#   <prefix>.json      標頭：格式版本、dtype、token 數、對應的 .bin 檔名、詞彙表與其他 metadata
+FORMAT_VERSION = 1
+
+
+def _header_path(prefix):
+    return prefix + ".json"
+
+
+# 標頭記錄的 .bin 路徑（舊版標頭沒有 bin 欄位，固定為 <prefix>.bin）
+def _bin_path(prefix, header):
+    return os.path.join(os.path.dirname(prefix), header.get("bin", os.path.basename(prefix) + ".bin"))
+
+
+def exists(prefix):
+    if not os.path.exists(_header_path(prefix)):
+        return False
+    return os.path.exists(_bin_path(prefix, read_header(prefix)))
+
+
+# 依詞彙表大小選擇最小可容納的整數型別
+def choose_dtype(vocab):
+    max_id = max(vocab.values(), default=0)
+    return np.uint16 if max_id < 2 ** 16 else np.uint32
+
+
+def _write_synced(path, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# 寫入 token store：token 先寫入新檔名的 .bin，再以 rename 取代標頭；
+# 標頭的 rename 是唯一的提交點，讀取端看到的標頭一定對應完整的 .bin。
+# 提交後刪除前一版的 .bin，已開啟 memmap 的讀取端不受影響（檔案在關閉前仍可讀取）
+def write_token_store(prefix, tokens, vocab, metadata=None):
+    header_path = _header_path(prefix)
+    directory = os.path.dirname(header_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    previous_bin = _bin_path(prefix, read_header(prefix)) if os.path.exists(header_path) else None
+
+    dtype = choose_dtype(vocab)
+    array = np.asarray(tokens, dtype=dtype).astype(np.dtype(dtype).newbyteorder("<"), copy=False)
+    bin_name = f"{os.path.basename(prefix)}.{uuid.uuid4().hex[:12]}.bin"
+    _write_synced(os.path.join(directory, bin_name), array.tofile)
+
+    header = {
+        "version": FORMAT_VERSION,
+        "dtype": np.dtype(dtype).name,
+        "num_tokens": int(array.size),
+        "bin": bin_name,
+        "vocab": vocab,
+        "metadata": dict(metadata or {}, created_at=time.strftime('%Y-%m-%d %H:%M:%S')),
+    }
+    data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    _write_synced(header_path + ".tmp", lambda f: f.write(data))
+    os.replace(header_path + ".tmp", header_path)
+
+    if previous_bin and os.path.basename(previous_bin) != bin_name and os.path.exists(previous_bin):
+        os.remove(previous_bin)
+    return header
+
+
+def read_header(prefix):
+    with open(_header_path(prefix), encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"不支援的 token store 版本: {header.get('version')}")
+    return header
+
+
+# 以唯讀 memmap 開啟 token 序列，回傳 (tokens, vocab, metadata)
+def open_token_store(prefix):
+    header = read_header(prefix)
+    bin_path = _bin_path(prefix, header)
+    dtype = np.dtype(header["dtype"]).newbyteorder("<")
+    expected_bytes = header["num_tokens"] * dtype.itemsize
+    actual_bytes = os.path.getsize(bin_path)
+    if actual_bytes != expected_bytes:
+        raise ValueError(f"{bin_path} 大小為 {actual_bytes} bytes，標頭記錄 {header['num_tokens']} 個 token "
+                         f"應為 {expected_bytes} bytes，token store 不完整")
+    if header["num_tokens"] == 0:
+        tokens = np.empty((0,), dtype=dtype)
+    else:
+        tokens = np.memmap(bin_path, dtype=dtype, mode="r", shape=(header["num_tokens"],))
+    return tokens, header["vocab"], header["metadata"]
+
+
+# 從 PDF/Word 文件建立 token store
+def build_token_store(prefix, pdf_paths=(), docx_paths=()):
+    from data_cleaning import clean_text
+    from data_extraction import extract_pdf_text, extract_word_text
+    from tokenization import build_vocab, text_to_tokens
+
+    texts = [extract_pdf_text(path) for path in pdf_paths]
+    texts += [extract_word_text(path) for path in docx_paths]
+    cleaned_text = clean_text("".join(texts))
+    vocab = build_vocab(cleaned_text)
+    tokens = text_to_tokens(cleaned_text, vocab)
+    return write_token_store(prefix, tokens, vocab, {
+        "sources": list(pdf_paths) + list(docx_paths),
+    })
+
+
+# 平行擷取整個目錄的文件並建立 token store
+def build_token_store_from_directory(prefix, root, max_workers=None, subword_vocab_size=None):
+    from corpus_ingest import iter_cleaned_corpus
+    from tokenization import build_vocab, text_to_tokens
+
+    documents = list(iter_cleaned_corpus(root, max_workers=max_workers))
+    metadata = {"sources": [os.path.abspath(root)]}
+    if subword_vocab_size:
+        return write_subword_token_store(prefix, documents, subword_vocab_size, metadata)
+
+    cleaned_text = " ".join(documents)
+    vocab = build_vocab(cleaned_text)
+    tokens = text_to_tokens(cleaned_text, vocab)
+    return write_token_store(prefix, tokens, vocab, metadata)
+
+
+# 以 subword tokenizer 編碼文件並建立 token store，tokenizer 另存為 <prefix>.<id>.tokenizer.json
+# （與 .bin 相同，每次使用新的檔名，由標頭的 metadata 指向，提交後刪除前一版）
+def write_subword_token_store(prefix, documents, vocab_size, metadata=None):
+    from tokenization import encode_batch, subword_vocab, train_subword_tokenizer
+
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    previous_tokenizer = None
+    if os.path.exists(_header_path(prefix)):
+        previous_tokenizer = read_header(prefix)["metadata"].get("tokenizer_path")
+
+    tokenizer_name = f"{os.path.basename(prefix)}.{uuid.uuid4().hex[:12]}.tokenizer.json"
+    tokenizer = train_subword_tokenizer(documents, vocab_size=vocab_size,
+                                        save_path=os.path.join(directory, tokenizer_name))
+    tokens = np.fromiter(
+        (token for ids in encode_batch(tokenizer, documents) for token in ids),
+        dtype=np.int64,
+    )
+    header = write_token_store(prefix, tokens, subword_vocab(tokenizer), dict(
+        metadata or {}, tokenizer="subword", tokenizer_path=tokenizer_name,
+    ))
+
+    if previous_tokenizer and previous_tokenizer != tokenizer_name:
+        previous_path = os.path.join(directory, previous_tokenizer)
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+    return header
+
+
+# token store 已存在時直接開啟，否則先從文件建立
+def load_or_build_token_store(prefix, pdf_paths=(), docx_paths=()):
+    if not exists(prefix):
+        build_token_store(prefix, pdf_paths, docx_paths)
+    return open_token_store(prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="將文件預處理為 token store")
+    parser.add_argument("--pdf", action="append", default=[], help="PDF 檔案路徑，可重複指定")
+    parser.add_argument("--docx", action="append", default=[], help="Word 檔案路徑，可重複指定")
+    parser.add_argument("--dir", default=None, help="文件目錄，指定時平行擷取目錄下所有 PDF 與 Word 文件")
+    parser.add_argument("--workers", type=int, default=None, help="平行擷取的行程數")
+    parser.add_argument("--subword-vocab-size", type=int, default=None, help="指定時改用 subword tokenizer 並設定詞彙表大小")
+    parser.add_argument("--out", default="ntnuchatAI/corpus", help="輸出路徑前綴（產生 .bin 與 .json）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.dir:
+        header = build_token_store_from_directory(
+            args.out, args.dir, max_workers=args.workers, subword_vocab_size=args.subword_vocab_size
+        )
+    else:
+        header = build_token_store(args.out, args.pdf, args.docx)
+    print(f"寫入 {header['num_tokens']} 個 token ({header['dtype']})，詞彙表大小 {len(header['vocab'])}，"
+          f"耗時 {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    tokens, vocab, metadata = open_token_store(args.out)
+    print(f"memmap 開啟耗時 {(time.perf_counter() - started) * 1000:.2f}ms，前 20 個 token: {tokens[:20].tolist()}")
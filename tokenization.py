@@ -1,16 +1,82 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 
 #03_tokenization:將文本轉換為 Token
+PAD_TOKEN = "<pad>"  # id 0，與序列補齊用的 0 一致
+UNK_TOKEN = "<unk>"  # id 1，詞彙表以外的詞
+SPECIAL_TOKENS = [PAD_TOKEN, UNK_TOKEN]
+
 # 构建词汇表
-def build_vocab(text):
-    words = text.split()
-    vocab = {word: idx for idx, word in enumerate(set(words), start=1)}
+# 依詞頻由高到低編號（同頻依字典序），每次建立的 id 都相同；
+# 可用 min_count 與 max_size 剪除罕見詞，縮小模型輸出層
+def build_vocab(text, min_count=1, max_size=None):
+    """
+    Args:
+        text: 文本字串，或逐塊產生文本的 iterable（只掃描一次）
+        min_count: 出現次數低於此值的詞不收錄
+        max_size: 詞彙表大小上限（含特殊 token），None 表示不限制
+    """
+    counts = Counter()
+    for chunk in ([text] if isinstance(text, str) else text):
+        counts.update(chunk.split())
+
+    words = sorted((word for word, count in counts.items() if count >= min_count and word not in SPECIAL_TOKENS),
+                   key=lambda word: (-counts[word], word))
+    if max_size is not None:
+        words = words[:max(0, max_size - len(SPECIAL_TOKENS))]
+
+    vocab = {token: idx for idx, token in enumerate(SPECIAL_TOKENS)}
+    vocab.update((word, idx) for idx, word in enumerate(words, start=len(SPECIAL_TOKENS)))
     return vocab
 
-# 转换文本为 Token
+# 转换文本为 Token（詞彙表有 <unk> 時，表外的詞對應到 <unk>，否則略過）
 def text_to_tokens(text, vocab):
-    tokens = [vocab[word] for word in text.split() if word in vocab]
-    return tokens
+    unk_id = vocab.get(UNK_TOKEN)
+    if unk_id is None:
+        return [vocab[word] for word in text.split() if word in vocab]
+    return [vocab.get(word, unk_id) for word in text.split()]
+
+# 子詞 (subword) tokenizer：SentencePiece 風格的 BPE，詞彙表大小固定，
+# 中文不會因為沒有空白而整句變成一個詞
+SUBWORD_SPECIAL_TOKENS = ["<pad>", "<unk>"]  # <pad> 的 id 為 0，與補齊用的 0 一致
+
+# 訓練 subword tokenizer，texts 可為字串或字串的 iterable
+def train_subword_tokenizer(texts, vocab_size=8000, min_frequency=2, save_path=None):
+    from tokenizers import SentencePieceBPETokenizer
+
+    if isinstance(texts, str):
+        texts = [texts]
+    tokenizer = SentencePieceBPETokenizer(unk_token="<unk>")
+    tokenizer.train_from_iterator(
+        texts,
+        vocab_size=vocab_size,
+        min_frequency=min_frequency,
+        special_tokens=SUBWORD_SPECIAL_TOKENS,
+    )
+    if save_path:
+        tokenizer.save(save_path)
+    return tokenizer
+
+def load_subword_tokenizer(path):
+    from tokenizers import Tokenizer
+
+    return Tokenizer.from_file(path)
+
+# 從 tokenizer.to_str() 的 JSON 字串還原（用於存在 checkpoint 中的 tokenizer）
+def subword_tokenizer_from_str(data):
+    from tokenizers import Tokenizer
+
+    return Tokenizer.from_str(data)
+
+# 批次編碼（在 Rust 端平行處理）
+def encode_batch(tokenizer, texts):
+    return [encoding.ids for encoding in tokenizer.encode_batch(list(texts))]
+
+def decode_batch(tokenizer, ids_batch):
+    return tokenizer.decode_batch([list(ids) for ids in ids_batch])
+
+# 子詞詞彙表 (token -> id)
+def subword_vocab(tokenizer):
+    return tokenizer.get_vocab()
 
 # 示例
 if __name__ == "__main__":
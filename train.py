@@ -1,6 +1,8 @@
+import mmap
+import numpy as np
 import torch
 import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
+from torch.utils.data import DataLoader, Dataset, TensorDataset
 from model import LanguageModel
 import torch.nn as nn
 
@@ -11,6 +13,67 @@ def load_data(inputs, targets, batch_size):
     loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
     return loader
 
+# 只保存一份扁平 token 陣列（可為 np.memmap），在 __getitem__ 時才切出視窗；
+# 來源是檔案時只記錄路徑，pickle 到 DataLoader worker 時不帶資料，各 worker 第一次讀取時自行開啟 memmap
+class WindowedTokenDataset(Dataset):
+    def __init__(self, tokens, seq_length):
+        """
+        Args:
+            tokens: 一維 token 陣列、np.memmap 或 .npy 檔案路徑（以 mmap 方式開啟）
+            seq_length: 輸入序列長度
+        """
+        self._source = None
+        if isinstance(tokens, str):
+            self._source = ('npy', tokens)
+            tokens = np.load(tokens, mmap_mode='r')
+        elif isinstance(tokens, np.memmap) and isinstance(tokens.base, mmap.mmap):
+            # 直接對應檔案的 memmap（切片後的 view 不記錄來源，照一般陣列處理）
+            self._source = ('memmap', tokens.filename, tokens.dtype.str, tokens.offset, tokens.shape)
+        self._tokens = tokens if isinstance(tokens, np.ndarray) else np.asarray(tokens, dtype=np.int64)
+        self._length = len(self._tokens)
+        self.seq_length = seq_length
+
+    def _open(self):
+        if self._source[0] == 'npy':
+            return np.load(self._source[1], mmap_mode='r')
+        _, filename, dtype, offset, shape = self._source
+        return np.memmap(filename, dtype=np.dtype(dtype), mode='r', offset=offset, shape=shape)
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = self._open()
+        return self._tokens
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._source is not None:
+            state['_tokens'] = None
+        return state
+
+    def __len__(self):
+        return max(0, self._length - self.seq_length)
+
+    def __getitem__(self, idx):
+        window = np.array(self.tokens[idx:idx + self.seq_length + 1], dtype=np.int64)
+        return torch.from_numpy(window[:-1]), torch.tensor(window[-1])
+
+# 以視窗資料集建立 DataLoader，多個 worker 並行切視窗並使用 pinned memory
+def load_windowed_data(tokens, seq_length, batch_size, num_workers=2, pin_memory=None):
+    dataset = WindowedTokenDataset(tokens, seq_length)
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        persistent_workers=num_workers > 0,
+        prefetch_factor=4 if num_workers > 0 else None,
+    )
+    return loader
+
 # 训练模型
 def train_model(model, loader, criterion, optimizer, epochs):
     for epoch in range(epochs):
@@ -24,22 +87,24 @@ def train_model(model, loader, criterion, optimizer, epochs):
 
 # 示例
 if __name__ == "__main__":
-    from data_preparation import create_sequences
-    from tokenization import build_vocab, text_to_tokens
-    from data_cleaning import clean_text
-    from data_extraction import extract_pdf_text, extract_word_text
-
-    pdf_text = extract_pdf_text("/Users/sma01/Downloads/testdata.pdf")
-    word_text = extract_word_text("/Users/sma01/Downloads/testdata.docx")
-    all_text = pdf_text + word_text
-    cleaned_text = clean_text(all_text)
-    vocab = build_vocab(cleaned_text)
-    tokens = text_to_tokens(cleaned_text, vocab)
+    import os
+
+    from save_load_model import save_model, subword_tokenizer_settings, word_tokenizer_settings
+    from token_store import load_or_build_token_store
+    from tokenization import load_subword_tokenizer
+
+    # 第一次執行時從文件建立 token store，之後直接以 memmap 開啟
+    corpus_prefix = "ntnuchatAI/corpus"
+    tokens, vocab, metadata = load_or_build_token_store(
+        corpus_prefix,
+        pdf_paths=["/Users/sma01/Downloads/testdata.pdf"],
+        docx_paths=["/Users/sma01/Downloads/testdata.docx"],
+    )
     seq_length = 10  # 序列长度
-    inputs, targets = create_sequences(tokens, seq_length)
 
     batch_size = 32
-    loader = load_data(inputs, targets, batch_size)
+    # 視窗在讀取時才切出，記憶體只與語料大小成正比
+    loader = load_windowed_data(tokens, seq_length, batch_size)
 
     vocab_size = len(vocab) + 1  # 词汇表大小
     embed_size = 128  # 嵌入维度
@@ -51,3 +116,13 @@ if __name__ == "__main__":
 
     epochs = 5
     train_model(model, loader, criterion, optimizer, epochs)
+
+    # 詞彙表、模型設定與 tokenizer 設定一起存入 checkpoint，生成時直接載入；
+    # subword 語料（token_store.py --subword-vocab-size）連同 tokenizer 本身一起存入
+    if metadata.get("tokenizer") == "subword":
+        tokenizer = load_subword_tokenizer(os.path.join(os.path.dirname(corpus_prefix), metadata["tokenizer_path"]))
+        tokenizer_settings = subword_tokenizer_settings(tokenizer, seq_length)
+    else:
+        tokenizer_settings = word_tokenizer_settings(seq_length)
+    save_model(model, vocab_size, "ntnuchatAI/language_model.pth",
+               vocab=vocab, tokenizer=tokenizer_settings)
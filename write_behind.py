@@ -0,0 +1,289 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+
+#25_write_behind:延後批次寫入資料庫
+# 請求只需把紀錄附加到本機 journal（fsync 後即視為持久化）並放入記憶體佇列，
+# 背景執行緒再批次交給 flush_fn 寫入資料庫。
+# journal 格式為 JSON Lines：{"seq": n, "data": {...}} 為紀錄，{"checkpoint": n} 表示 seq <= n 的紀錄已寫入。
+# 每個行程使用自己的 journal（journal-<pid>.jsonl）並以 flock 鎖住；
+# 啟動時接手已無行程持有的 journal，重新寫入其中尚未寫入的紀錄。
+# 在寫入資料庫之後、checkpoint 落地之前當機時，重播會再次寫入同一批紀錄（至少一次），
+# 呼叫端應在紀錄中帶唯一 id，由資料庫的唯一索引排除重複。
+# 只有暫時性錯誤（is_retryable 判定，例如斷線）會重試整個批次；其他錯誤改為逐筆寫入，
+# 仍失敗的紀錄移到 dead-letter.jsonl 並離開佇列，不會擋住之後的紀錄
+DEAD_LETTER_FILENAME = "dead-letter.jsonl"
+
+
+def read_journal(path):
+    """
+    回傳 journal 中尚未寫入（seq 大於最後一個 checkpoint）的紀錄 [(seq, data)]
+    """
+    records = []
+    checkpoint = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 寫到一半就當機的最後一行
+                continue
+            if "checkpoint" in entry:
+                checkpoint = max(checkpoint, entry["checkpoint"])
+            else:
+                records.append((entry["seq"], entry["data"]))
+    return [(seq, data) for seq, data in records if seq > checkpoint]
+
+
+class WriteBehindWriter:
+    def __init__(self, flush_fn, journal_dir, max_batch_size=500, flush_interval_ms=200,
+                 max_journal_mb=64, name="write-behind", is_retryable=None):
+        """
+        Args:
+            flush_fn: 接收紀錄（dict）列表並寫入資料庫的函數，失敗時拋出例外
+            journal_dir: journal 檔案目錄
+            max_batch_size: 每次寫入的最多紀錄數
+            flush_interval_ms: 收到第一筆紀錄後最多等待多久再寫入
+            max_journal_mb: journal 超過此大小時壓縮成只含未寫入的紀錄
+            name: 背景執行緒名稱（方便除錯）
+            is_retryable: 判斷 flush_fn 的例外是否為暫時性錯誤（之後重試）的函數，
+                          預設所有例外都重試
+        """
+        self.flush_fn = flush_fn
+        self.is_retryable = is_retryable or (lambda e: True)
+        self.dead_letter_path = os.path.join(journal_dir, DEAD_LETTER_FILENAME)
+        self.journal_dir = journal_dir
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.flush_interval = max(0.0, flush_interval_ms / 1000.0)
+        self.max_journal_bytes = max_journal_mb * 1024 * 1024
+        self.name = name
+        os.makedirs(journal_dir, exist_ok=True)
+        self._start()
+        # fork 出的子行程改用自己的 journal 與背景執行緒，父行程的佇列仍由父行程寫入
+        os.register_at_fork(after_in_child=self._start)
+        atexit.register(self.flush, 5)
+
+    def _start(self):
+        if getattr(self, "_journal", None) is not None:
+            # 子行程關閉繼承來的 journal（父行程仍持有鎖）
+            self._journal.close()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = deque()  # (seq, data)
+        self._seq = 0
+        self._flushed_seq = 0  # seq 不大於此值的紀錄都已寫入資料庫
+        self._flush_waiters = 0  # 正在 flush() 等待的呼叫數，大於 0 時不等批次窗口
+        self.flushed = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self._journal_path = os.path.join(self.journal_dir, f"journal-{os.getpid()}.jsonl")
+        self._journal = self._open_locked(self._journal_path, "a")
+        self._recover()
+        self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._worker.start()
+
+    @staticmethod
+    def _open_locked(path, mode, blocking=True):
+        f = open(path, mode, encoding="utf-8")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            f.close()
+            raise
+        return f
+
+    # 接手已無行程持有的 journal（包括同一 pid 在前次執行留下的內容）
+    # 順序：先把所有未寫入的紀錄寫入新的 journal 並 fsync，再移除舊檔，
+    # 任一步驟當機都不會遺失紀錄（最多重複重播）
+    def _recover(self):
+        recovered = [data for _, data in read_journal(self._journal_path)]
+        orphans = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "journal-*.jsonl"))):
+            if path == self._journal_path:
+                continue
+            try:
+                orphan = self._open_locked(path, "r", blocking=False)
+            except OSError:
+                continue  # 仍有行程在使用
+            orphans.append((path, orphan))
+            recovered.extend(data for _, data in read_journal(path))
+
+        try:
+            if recovered:
+                print(f"[{self.name}] 從 journal 恢復 {len(recovered)} 筆未寫入的紀錄")  # 添加日誌
+                for data in recovered:
+                    self._seq += 1
+                    self._pending.append((self._seq, data))
+                # 以 rename 原子地取代自己的 journal，內容只含重新編號的紀錄
+                self._compact()
+            for path, _ in orphans:
+                os.remove(path)
+            if orphans:
+                self._fsync_dir()
+        finally:
+            for _, orphan in orphans:
+                orphan.close()
+
+    def _fsync_dir(self):
+        fd = os.open(self.journal_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _append_journal(self, entries):
+        self._journal.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def submit(self, records):
+        """
+        寫入 journal 並加入佇列後立即返回，不等待資料庫
+        """
+        with self._lock:
+            entries = []
+            for data in records:
+                self._seq += 1
+                entries.append({"seq": self._seq, "data": data})
+            self._append_journal(entries)
+            self._pending.extend((entry["seq"], entry["data"]) for entry in entries)
+            self._changed.notify_all()
+
+    # 等待呼叫當下已提交的紀錄寫入資料庫（之後才提交的不必等），逾時回傳 False
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            target = self._seq
+            if self._flushed_seq >= target:
+                return True
+            self._flush_waiters += 1
+            # 喚醒正在等批次窗口的背景執行緒，立即寫入
+            self._changed.notify_all()
+            try:
+                while self._flushed_seq < target:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._changed.wait(remaining)
+            finally:
+                self._flush_waiters -= 1
+        return True
+
+    # 收集一個批次：先等第一筆，之後在時間窗口內盡量補滿（有人在 flush 等待時立即送出）；
+    # 紀錄寫入成功前仍留在佇列中
+    def _collect(self):
+        with self._lock:
+            while not self._pending:
+                self._changed.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.max_batch_size and not self._flush_waiters:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return [self._pending[i] for i in range(min(self.max_batch_size, len(self._pending)))]
+
+    def _checkpoint(self, batch):
+        with self._lock:
+            for _ in batch:
+                self._pending.popleft()
+            self.flushed += len(batch)
+            self._flushed_seq = batch[-1][0]
+            if not self._pending:
+                # 全部寫入後清空 journal
+                self._journal.seek(0)
+                self._journal.truncate()
+                os.fsync(self._journal.fileno())
+            elif self._journal.tell() > self.max_journal_bytes:
+                self._compact()
+            else:
+                self._append_journal([{"checkpoint": batch[-1][0]}])
+            self._changed.notify_all()
+
+    # 只保留未寫入的紀錄：先寫入並鎖住暫存檔，再以 rename 取代
+    def _compact(self):
+        tmp_path = self._journal_path + ".tmp"
+        tmp = self._open_locked(tmp_path, "w")
+        tmp.write("".join(json.dumps({"seq": seq, "data": data}, ensure_ascii=False) + "\n"
+                          for seq, data in self._pending))
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        os.replace(tmp_path, self._journal_path)
+        self._fsync_dir()
+        self._journal.close()
+        self._journal = tmp
+
+    # 寫入一個批次；暫時性錯誤向上拋出由 _run 重試，其他錯誤改為逐筆寫入，仍失敗的移到 dead-letter
+    def _write(self, batch):
+        try:
+            self.flush_fn([data for _, data in batch])
+            return
+        except Exception as e:
+            if self.is_retryable(e):
+                raise
+            if len(batch) == 1:
+                self._dead_letter(batch[0][1], e)
+                return
+            print(f"[{self.name}] 批次寫入失敗（{len(batch)} 筆），改為逐筆寫入: {e}")  # 添加日誌
+        for _, data in batch:
+            try:
+                self.flush_fn([data])
+            except Exception as e:
+                if self.is_retryable(e):
+                    raise
+                self._dead_letter(data, e)
+
+    def _dead_letter(self, data, error):
+        entry = {"data": data, "error": str(error), "failed_at": time.strftime('%Y-%m-%d %H:%M:%S')}
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self.dead_lettered += 1
+        print(f"[{self.name}] 無法寫入的紀錄已移到 {self.dead_letter_path}: {error}")  # 添加日誌
+
+    def _run(self):
+        retries = 0
+        while True:
+            batch = self._collect()
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.failures += 1
+                retries += 1
+                delay = min(2 ** retries * 0.1, 30)
+                print(f"[{self.name}] 批次寫入失敗（{len(batch)} 筆），{delay:.1f}s 後重試: {e}")  # 添加日誌
+                time.sleep(delay)
+                continue
+            retries = 0
+            self._checkpoint(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'flushed': self.flushed,
+                'failures': self.failures,
+                'dead_lettered': self.dead_lettered,
+                'journal_bytes': self._journal.tell(),
+            }
+
+
+# 示例
+if __name__ == "__main__":
+    import tempfile
+
+    def fake_flush(records):
+        print(f"批次寫入 {len(records)} 筆")
+
+    writer = WriteBehindWriter(fake_flush, tempfile.mkdtemp(), max_batch_size=4, flush_interval_ms=30)
+    for i in range(10):
+        writer.submit([{"message": f"message {i}"}])
+    writer.flush()
+    print(writer.stats())